@@ -2,41 +2,74 @@
 from dotenv import load_dotenv
 load_dotenv()  # <-- make env vars from .env visible to this process
 
-import os, openai, json
+import os, json, threading
+from functools import lru_cache
 from typing import List, Dict
-from rag_store import RAGStore
+import keywords
+import startup
 
-openai.api_key = os.environ.get("OPENAI_API_KEY")
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
 TOP_K = int(os.environ.get("TOP_K", "6"))
+FILTER_BY_INTENT = os.environ.get("FILTER_BY_INTENT", "1") == "1"
 RTCFR_PATH = "rtcfr_system_prompt.md"
 
-# Read RTCFR system prompt (the long system prompt you saved)
-with open(RTCFR_PATH, "r", encoding="utf-8") as f:
-    RTCFR_TEXT = f.read()
+# Nothing heavy happens at import: tools that only need route_intent stay fast, and the
+# Streamlit page renders while the model and KB load (preload) in the background.
+_rag, _rag_lock = None, threading.Lock()
+_preloading, _preload_lock = False, threading.Lock()
 
-rag = RAGStore()
+def get_rag():
+    # The process-wide RAGStore (model, index, docstore), created on first use and shared
+    # by every Streamlit session.
+    global _rag
+    if _rag is None:
+        with _rag_lock:
+            if _rag is None:
+                with startup.phase("RAGStore ready (total)"):
+                    from rag_store import RAGStore
+                    _rag = RAGStore()
+    return _rag
+
+def rag_ready() -> bool:
+    return _rag is not None
+
+def preload():
+    # get_rag() on a background thread (once per process), so the first question does
+    # not pay for the model load
+    global _preloading
+    with _preload_lock:  # not _rag_lock: that is held for the whole load
+        if _rag is not None or _preloading:
+            return
+        _preloading = True
+    threading.Thread(target=get_rag, daemon=True).start()
+
+@lru_cache(maxsize=None)
+def rtcfr_text() -> str:
+    # Read RTCFR system prompt (the long system prompt you saved)
+    with open(RTCFR_PATH, "r", encoding="utf-8") as f:
+        return f.read()
+
+def __getattr__(name):
+    # agents.rag / agents.RTCFR_TEXT, as before; loaded on first access
+    if name == "rag":
+        return get_rag()
+    if name == "RTCFR_TEXT":
+        return rtcfr_text()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def route_intent(user_text: str, hits: List[Dict]) -> str:
-    t = user_text.lower()
-    if any(k in t for k in ["price","pricing","quote","cost","package","buy","purchase","service","lead"]):
-        return "sales_services"
-    if any(k in t for k in ["refund","warranty","policy","support","repair","return"]):
-        return "support_policies"
-    if any(k in t for k in ["contact","phone","email","address","where","location","hours","timing"]):
-        return "logistics_contact"
-    if any(k in t for k in ["about","team","who are you","case study","projects","portfolio"]):
-        return "general_about"
+    label = keywords.intent_matcher().first(user_text)
+    if label:
+        return label
     # fallback: examine tags in hits
-    votes = {"sales_services":0,"support_policies":0,"logistics_contact":0,"general_about":0}
+    tag_intents = keywords.tag_intents()
+    votes = {l: 0 for l in keywords.intent_matcher().labels_order}
     for h in hits:
         for tag in h.get("tags",[]):
-            if tag in ("services","pricing"): votes["sales_services"]+=1
-            if tag in ("faq","policy","support"): votes["support_policies"]+=1
-            if tag in ("contact","location"): votes["logistics_contact"]+=1
-            if tag in ("about","general","case_studies"): votes["general_about"]+=1
-    winner = max(votes, key=votes.get)
-    return winner if votes[winner]>0 else "general_about"
+            if tag in tag_intents:
+                votes[tag_intents[tag]] = votes.get(tag_intents[tag], 0) + 1
+    winner = max(votes, key=votes.get, default="general_about")
+    return winner if votes.get(winner) else "general_about"
 
 def build_system_for_agent(agent_label: str) -> str:
     agent_suffix = {
@@ -45,7 +78,7 @@ def build_system_for_agent(agent_label: str) -> str:
         "logistics_contact": "You are Logistics & Contact Specialist — answer only from retrieved site documents. Use the Answer Contract.",
         "general_about": "You are General Info Specialist — answer only from retrieved site documents. Use the Answer Contract."
     }
-    return RTCFR_TEXT + "\n\n" + agent_suffix.get(agent_label, "")
+    return rtcfr_text() + "\n\n" + agent_suffix.get(agent_label, "")
 
 def compose_user_prompt(user_text: str, hits: List[Dict]) -> str:
     # Build a short summary of top-k retrieved docs to be used as context
@@ -71,6 +104,8 @@ def call_llm(system_prompt: str, user_prompt: str) -> str:
         {"role":"user", "content": user_prompt}
     ]
     # Use chat completion
+    import openai  # deferred: only answering needs it
+    openai.api_key = os.environ.get("OPENAI_API_KEY")
     resp = openai.ChatCompletion.create(model=OPENAI_MODEL, messages=messages, temperature=0.0, max_tokens=700)
     txt = ""
     try:
@@ -79,8 +114,15 @@ def call_llm(system_prompt: str, user_prompt: str) -> str:
         txt = "Error: LLM did not return content."
     return txt
 
+def retrieve(user_text: str) -> List[Dict]:
+    # When the question itself names an intent, that specialist's chunk tags come first
+    # (pricing/services for sales, ...); the rest of the k slots from the whole KB.
+    label = keywords.intent_matcher().first(user_text) if FILTER_BY_INTENT else None
+    tags = keywords.intent_tags(label) if label else []
+    return get_rag().search(user_text, k=TOP_K, prefer={"tags": tags} if tags else None)
+
 def answer(user_text: str, session_state: dict) -> dict:
-    hits = rag.search(user_text, k=TOP_K)
+    hits = retrieve(user_text)
     label = route_intent(user_text, hits)
     prev = session_state.get("label")
     handoff = None
@@ -0,0 +1,131 @@
+# ann.py
+import os, math
+import numpy as np
+import faiss
+
+INDEX_TYPE = os.environ.get("INDEX_TYPE", "flat").lower()  # flat | ivf | hnsw | ivfpq
+IVF_NLIST = int(os.environ.get("IVF_NLIST", "0"))  # 0: ~4*sqrt(n)
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", "16"))
+HNSW_M = int(os.environ.get("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", "64"))
+HNSW_FILTER_MAX_EF = int(os.environ.get("HNSW_FILTER_MAX_EF", "1024"))  # efSearch ceiling for filtered searches
+HNSW_FILTER_SCAN = float(os.environ.get("HNSW_FILTER_SCAN", "0.05"))  # filters passing fewer: scan, no graph
+PQ_M = int(os.environ.get("PQ_M", "0"))  # sub-quantizers, 0: dim/8 (rounded to a divisor of dim)
+PQ_NBITS = int(os.environ.get("PQ_NBITS", "8"))
+ANN_RETRAIN_GROWTH = float(os.environ.get("ANN_RETRAIN_GROWTH", "2.0"))
+VECTOR_STORAGE = os.environ.get("VECTOR_STORAGE", "fp32").lower()  # fp32 | fp16 | int8 (not used by ivfpq)
+INDEX_MMAP = os.environ.get("INDEX_MMAP", "1") == "1"
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+STORAGES = {"fp32": "Flat", "fp16": "SQfp16", "int8": "SQ8"}
+
+def index_params(n, dim, index_type=INDEX_TYPE, storage=VECTOR_STORAGE):
+    # Concrete parameters for n vectors. Every index is inner product over normalized
+    # vectors (cosine). Types that need more training points than the corpus has fall
+    # back to the next simpler one.
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"INDEX_TYPE must be one of {', '.join(INDEX_TYPES)}, not {index_type!r}")
+    if storage not in STORAGES:
+        raise ValueError(f"VECTOR_STORAGE must be one of {', '.join(STORAGES)}, not {storage!r}")
+    p = {"type": index_type, "metric": "ip", "storage": "pq" if index_type == "ivfpq" else storage}
+    if index_type in ("ivf", "ivfpq"):
+        nlist = IVF_NLIST or int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n // 39))  # k-means wants ~39 points per centroid
+        if nlist < 2:
+            return index_params(n, dim, "flat", storage)
+        p.update(nlist=nlist, nprobe=min(IVF_NPROBE, nlist))
+    if index_type == "ivfpq":
+        target = PQ_M or max(1, dim // 8)
+        m = max(d for d in range(1, min(target, dim) + 1) if dim % d == 0)
+        nbits = min(PQ_NBITS, int(math.log2(max(2, n // 39))))  # 2**nbits codewords, ~39 points each
+        if nbits < 4:
+            return index_params(n, dim, "ivf", storage)
+        p.update(m=m, nbits=nbits)
+    if index_type == "hnsw":
+        p.update(M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, ef_search=HNSW_EF_SEARCH)
+    return p
+
+def factory_string(p):
+    codec = STORAGES.get(p.get("storage", "fp32"), "Flat")
+    return {"flat": f"IDMap2,{codec}",
+            "ivf": f"IVF{p.get('nlist')},{codec}",
+            "hnsw": f"IDMap2,HNSW{p.get('M')}" + ("" if codec == "Flat" else f"_{codec}"),
+            "ivfpq": f"IVF{p.get('nlist')},PQ{p.get('m')}x{p.get('nbits')}"}[p["type"]]
+
+def build_index(X, ids, p):
+    # Train (IVF / PQ) on all vectors and add them under their stable chunk ids.
+    X = np.ascontiguousarray(X, dtype="float32")
+    index = faiss.index_factory(X.shape[1], factory_string(p), faiss.METRIC_INNER_PRODUCT)
+    if p["type"] == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = p["ef_construction"]
+    if not index.is_trained:
+        index.train(X)
+    index.add_with_ids(X, np.asarray(ids, dtype="int64"))
+    configure(index, p)
+    return index
+
+def same_layout(a, b):
+    storage = lambda p: p.get("storage") or ("pq" if p["type"] == "ivfpq" else "fp32")
+    return a["type"] == b["type"] and storage(a) == storage(b)
+
+def can_update(index, p, removed, new_total):
+    # In-place add/remove is fine for flat and IVF lists; HNSW graphs cannot delete, and
+    # IVF centroids / int8 ranges trained on a much smaller (or larger) corpus are retrained.
+    if p["type"] == "hnsw" and removed:
+        return False
+    if p["type"] in ("ivf", "ivfpq") or p.get("storage") == "int8":
+        trained_on = p.get("trained_on") or index.ntotal or 1
+        return 1 / ANN_RETRAIN_GROWTH <= new_total / trained_on <= ANN_RETRAIN_GROWTH
+    return True
+
+def configure(index, p, nprobe=None, ef_search=None):
+    # Search-time knobs from the stored parameters (environment overrides win).
+    if p.get("type") in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = nprobe or int(os.environ.get("IVF_NPROBE") or p.get("nprobe") or 1)
+    elif p.get("type") == "hnsw":
+        inner = faiss.downcast_index(index.index) if hasattr(index, "index") else index
+        inner.hnsw.efSearch = ef_search or int(os.environ.get("HNSW_EF_SEARCH") or p.get("ef_search") or 16)
+    return index
+
+def read_index(path, p=None, mmap=INDEX_MMAP):
+    # Serving side: map the file instead of reading it, so cold start does not pull the
+    # whole index in and every process on the box shares one page-cached copy. The
+    # mapped index is read-only; curate.py replaces the file rather than editing it.
+    if mmap:
+        ivf = (p or {}).get("type") in ("ivf", "ivfpq")
+        flags = faiss.IO_FLAG_MMAP if ivf else getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        if flags:
+            try:
+                return faiss.read_index(path, flags | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                pass  # index type or faiss build without mmap support
+    return faiss.read_index(path)
+
+def empty_index(dim):
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+def search_params(index, p, sel, fraction=1.0):
+    # SearchParameters carrying an IDSelector. They replace the index's own search-time
+    # knobs, so nprobe / efSearch are copied from the index as configured, and widened
+    # by 1 / fraction (the share of vectors the selector lets through): a narrow filter
+    # leaves few matches in the usual lists / graph neighbourhood.
+    widen = lambda v, cap: int(min(cap, math.ceil(v / math.sqrt(max(fraction, 1e-6)))))
+    if p.get("type") in ("ivf", "ivfpq"):
+        ivf = faiss.extract_index_ivf(index)
+        return faiss.SearchParametersIVF(sel=sel, nprobe=widen(ivf.nprobe, ivf.nlist))
+    if p.get("type") == "hnsw":
+        inner = faiss.downcast_index(index.index) if hasattr(index, "index") else index
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=widen(inner.hnsw.efSearch, HNSW_FILTER_MAX_EF))
+    return faiss.SearchParameters(sel=sel)
+
+def search(index, p, Q, k, sel=None, fraction=1.0):
+    # index.search(Q, k), optionally limited to the ids sel lets through (fraction of the
+    # index). Through HNSW, a narrow filter is answered by scanning the stored vectors
+    # instead: exact, and cheaper than a graph walk that has to step over the rest.
+    if sel is None:
+        return index.search(Q, k)
+    if p.get("type") == "hnsw" and fraction < HNSW_FILTER_SCAN and hasattr(index, "id_map"):
+        storage = faiss.downcast_index(index.index).storage
+        D, I = storage.search(Q, k, params=faiss.SearchParameters(sel=faiss.IDSelectorTranslated(index.id_map, sel)))
+        return D, np.where(I >= 0, faiss.vector_to_array(index.id_map)[I.clip(0)], -1)
+    return index.search(Q, k, params=search_params(index, p, sel, fraction))
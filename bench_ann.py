@@ -0,0 +1,83 @@
+# bench_ann.py
+# Recall@k against exact (flat) search, p50/p99 single-query latency, build time and
+# index size for every INDEX_TYPE. Vectors come from the KB (docstore ids + embedding
+# cache), or --synthetic N clustered random vectors to try corpus sizes we don't have:
+#   python bench_ann.py [--synthetic N] [--dim D] [--queries Q] [--k K]
+import os, sys, time
+import numpy as np
+import faiss
+import ann
+import embedder
+import kb_versions
+from docstore import DocStore, DOCSTORE_FILE
+from emb_cache import EmbeddingCache
+
+KB_DIR = os.environ.get("KB_DIR", "kb")
+EMB_MODEL = os.environ.get("EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+def arg(args, name, default):
+    return int(args[args.index(name) + 1]) if name in args else default
+
+def normalize(X):
+    return (X / np.clip(np.linalg.norm(X, axis=1, keepdims=True), 1e-12, None)).astype("float32")
+
+def kb_vectors():
+    path = kb_versions.active_dir(KB_DIR)
+    if path is None or not os.path.exists(os.path.join(path, DOCSTORE_FILE)):
+        return np.empty((0, 0), dtype="float32")
+    store = DocStore(os.path.join(path, DOCSTORE_FILE))
+    keys = store.keys()
+    store.close()
+    cache = EmbeddingCache()
+    vecs = cache.get_many(embedder.cache_key(EMB_MODEL), [c for _, c in keys.values()])
+    cache.close()
+    X = np.vstack([vecs[c] for _, c in keys.values() if c in vecs]) if vecs else np.empty((0, 0))
+    return X.astype("float32")
+
+def synthetic(n, dim, rng, clusters=None):
+    clusters = clusters or max(8, int(np.sqrt(n)))
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    X = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+    return normalize(X)
+
+def main():
+    args = sys.argv[1:]
+    k, nq = arg(args, "--k", 10), arg(args, "--queries", 500)
+    rng = np.random.default_rng(0)
+    if "--synthetic" in args:
+        X = synthetic(arg(args, "--synthetic", 100000), arg(args, "--dim", 384), rng)
+        source = "synthetic"
+    else:
+        X = kb_vectors()
+        source = f"{KB_DIR} ({EMB_MODEL})"
+    if len(X) == 0:
+        raise SystemExit("No vectors. Build the KB with curate.py first, or pass --synthetic N.")
+    # queries: corpus vectors nudged off their exact position
+    Q = normalize(X[rng.integers(0, len(X), nq)] + 0.05 * rng.standard_normal((nq, X.shape[1])).astype("float32"))
+    ids = np.arange(len(X))
+    exact = faiss.IndexFlatIP(X.shape[1])
+    exact.add(X)
+    truth, _ = exact.search(Q, k)
+    kth = truth[:, -1:] - 1e-5
+    print(f"{len(X)} vectors x {X.shape[1]} dims from {source}; {nq} queries, recall@{k} vs exact search")
+    print(f"{'index':<22} {'build s':>8} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'size MB':>8}")
+    for index_type in ann.INDEX_TYPES:
+        p = ann.index_params(len(X), X.shape[1], index_type)
+        t0 = time.perf_counter()
+        index = ann.build_index(X, ids, p)
+        build = time.perf_counter() - t0
+        _, found = index.search(Q, k)
+        # a hit counts if its exact score reaches the k-th best, so tied duplicates are not misses
+        scores = np.einsum("qkd,qd->qk", X[np.clip(found, 0, None)], Q)
+        recall = np.mean(((scores >= kth) & (found >= 0)).sum(axis=1) / k)
+        lat = []
+        for q in Q:
+            t0 = time.perf_counter()
+            index.search(q[None], k)
+            lat.append((time.perf_counter() - t0) * 1000)
+        size = faiss.serialize_index(index).nbytes / 1e6
+        label = ann.factory_string(p) + ("" if p["type"] == index_type else f" ({index_type})")
+        print(f"{label:<22} {build:8.2f} {recall:7.3f} {np.percentile(lat, 50):8.3f} {np.percentile(lat, 99):8.3f} {size:8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# bench_bm25.py
+# Build time, size on disk and per-query latency (p50 / p90 / p99) of the BM25 index in
+# lexical.py, with the partial scan (BM25_SCAN_POSTINGS) and with every posting summed,
+# and whether both give the same top-k scores (ties at the cut-off may pick different
+# chunks). Over the KB's chunks or --synthetic N chunks with a Zipf vocabulary and
+# product-code-like tokens (to try corpus sizes we don't have):
+#   python bench_bm25.py [--synthetic N] [--queries Q] [--k K]
+import os, sys, time, tempfile
+import numpy as np
+import kb_versions
+import lexical
+from docstore import DocStore, DOCSTORE_FILE
+
+KB_DIR = os.environ.get("KB_DIR", "kb")
+
+def arg(args, name, default):
+    return int(args[args.index(name) + 1]) if name in args else default
+
+def kb_texts():
+    path = kb_versions.active_dir(KB_DIR)
+    if path is None or not os.path.exists(os.path.join(path, DOCSTORE_FILE)):
+        return {}
+    store = DocStore(os.path.join(path, DOCSTORE_FILE))
+    docs = dict(store.db.execute("SELECT id, content FROM docs"))
+    store.close()
+    return docs
+
+def synthetic(n, rng, vocab=50000, length=180):
+    words = np.array([f"w{i}" for i in range(vocab)])
+    p = 1 / np.arange(1, vocab + 1) ** 1.1
+    p /= p.sum()
+    docs = {}
+    for i in range(n):
+        text = " ".join(words[rng.choice(vocab, length, p=p)])
+        docs[i] = f"{text} model hx-{rng.integers(0, n)} call 555-{rng.integers(1000, 9999)}"
+    return docs
+
+def main():
+    args = sys.argv[1:]
+    k, nq = arg(args, "--k", 12), arg(args, "--queries", 1000)
+    rng = np.random.default_rng(0)
+    if "--synthetic" in args:
+        docs, source = synthetic(arg(args, "--synthetic", 100000), rng), "synthetic"
+    else:
+        docs, source = kb_texts(), KB_DIR
+    if not docs:
+        raise SystemExit("No chunks. Build the KB with curate.py first, or pass --synthetic N.")
+    texts = list(docs.values())
+    queries = []
+    for _ in range(nq):  # a few words (or a code) lifted from a random chunk
+        toks = texts[rng.integers(0, len(texts))].split()
+        size = int(rng.integers(1, 6))
+        start = int(rng.integers(0, max(1, len(toks) - size)))
+        queries.append(" ".join(toks[start:start + size]))
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        postings = lexical.build(docs, tmp)
+        build = time.perf_counter() - t0
+        size = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+        t0 = time.perf_counter()
+        index = lexical.LexicalIndex(tmp)
+        load = time.perf_counter() - t0
+        for q in queries[:50]:
+            index.search(q, k)
+        lat, full, same = [], [], 0
+        for q in queries:
+            t0 = time.perf_counter()
+            scores, _ = index.search(q, k)
+            lat.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            exact, _ = index.search(q, k, scan=0)
+            full.append((time.perf_counter() - t0) * 1000)
+            same += len(scores) == len(exact) and np.allclose(scores, exact, atol=1e-5)
+    print(f"{len(docs)} chunks from {source}: {postings} postings, {len(index.terms)} terms, "
+          f"{size / 1e6:.1f} MB, built in {build:.1f}s, loaded in {load * 1000:.0f} ms")
+    print(f"{nq} queries, top-{k}:")
+    for label, ms in ((f"scan {lexical.BM25_SCAN_POSTINGS}", lat), ("every posting", full)):
+        p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+        print(f"  {label:<14} p50 {p50:.3f} ms  p90 {p90:.3f} ms  p99 {p99:.3f} ms  max {max(ms):.3f} ms")
+    print(f"  same top-{k} scores: {same}/{nq}")
+
+if __name__ == "__main__":
+    main()
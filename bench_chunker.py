@@ -0,0 +1,62 @@
+# bench_chunker.py
+# Old character-based chunk_text vs chunker.py: chunk count, how many chunks the
+# embedding model would truncate, how big they are in tokens, and chunking speed.
+# Reads the markdown of pages in the crawler's page cache (or a directory of .html /
+# .html.gz files given on the command line):
+#   python bench_chunker.py [html_dir] [--limit N]
+import os, sys, time
+from nltk import sent_tokenize
+from page_cache import PAGE_CACHE_DIR
+from extract import extract_text
+from bench_extract import load_pages
+import chunker
+
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "900"))
+OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "120"))
+
+def legacy_chunk_text(text):
+    # curate.chunk_text before chunker.py: ~CHUNK_SIZE characters plus the last OVERLAP
+    # characters of the previous chunk.
+    sents = sent_tokenize(text)
+    chunks = []
+    buff = ""
+    for s in sents:
+        if len(buff) + len(s) < CHUNK_SIZE:
+            buff += (" " + s)
+        else:
+            chunks.append(buff.strip())
+            buff = s
+    if buff.strip():
+        chunks.append(buff.strip())
+    out = []
+    for i,c in enumerate(chunks):
+        prev = chunks[i-1][-OVERLAP:] if i>0 else ""
+        out.append((prev + "\n" + c).strip())
+    return out
+
+def run(label, fn, texts, tok, limit):
+    t0 = time.perf_counter()
+    chunks = [c for t in texts for c in fn(t)]
+    dt = time.perf_counter() - t0
+    sizes = sorted(n + tok.specials() for n in tok.count(chunks))
+    over = sum(1 for n in sizes if n > limit)
+    p = lambda q: sizes[min(len(sizes) - 1, int(q * len(sizes)))] if sizes else 0
+    print(f"{label:<20} {len(chunks):7d} chunks  {over / max(1, len(chunks)):6.1%} truncated  "
+          f"tokens p50 {p(0.5):4d} p95 {p(0.95):4d} max {p(1.0):5d}  {len(texts) / dt:8.1f} pages/s")
+
+def main():
+    args = sys.argv[1:]
+    limit = int(args[args.index("--limit") + 1]) if "--limit" in args else 2000
+    root = next((a for a in args if not a.startswith("--") and not a.isdigit()), PAGE_CACHE_DIR)
+    texts = [extract_text(h) for h in load_pages(root, limit)]
+    if not texts:
+        raise SystemExit(f"No pages found under {root}. Run crawler.py first or pass a directory.")
+    tok = chunker.tokenizer()
+    max_len = min(chunker.CHUNK_TOKENS, tok.model_max_length)
+    print(f"{len(texts)} pages from {root}; model accepts {max_len} tokens ({type(tok).__name__})")
+    chunker.chunk_text("warm up the tokenizer.")
+    run("chunk_text (chars)", legacy_chunk_text, texts, tok, max_len)
+    run("chunker (tokens)", chunker.chunk_text, texts, tok, max_len)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# bench_extract.py
+# Pages/sec of the old BeautifulSoup+markdownify path vs extract.py (one process and
+# the process pool). Reads pages from the crawler's page cache, or from a directory
+# of .html / .html.gz files given on the command line. First checks extract.py on
+# common WordPress page-builder markup (FIXTURES: content kept, chrome dropped) and exits
+# non-zero if any fixture fails:
+#   python bench_extract.py [html_dir] [--limit N]
+import os, sys, gzip, time
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup
+from markdownify import markdownify as md
+from page_cache import PAGE_CACHE_DIR
+from extract import extract_text, EXTRACT_WORKERS
+
+PAGE = """<html><head><title>Services</title></head><body>
+<header class="site-header"><a href="/">Home</a> <a href="/services">Services</a></header>
+{}
+<div id="cookie-notice" class="cmplz-cookiebanner">We use cookies. Accept all</div>
+<footer class="site-footer">Copyright Example Ltd</footer></body></html>"""
+CONTENT = ("We repair commercial refrigeration units", "Same-day call-outs across the region")
+CHROME = ("We use cookies", "Copyright Example Ltd", "Share on Facebook", "Main menu link")
+# (builder, page body): each must keep CONTENT and drop CHROME
+FIXTURES = [
+    ("elementor", """<div data-elementor-type="wp-page" class="elementor elementor-42">
+<section class="elementor-section elementor-top-section"><div class="elementor-container">
+<div class="elementor-column"><div class="elementor-widget-wrap">
+<div class="elementor-element elementor-widget elementor-widget-heading"><div class="elementor-widget-container">
+<h2 class="elementor-heading-title">We repair commercial refrigeration units</h2></div></div>
+<div class="elementor-element elementor-widget elementor-widget-text-editor"><div class="elementor-widget-container">
+<p>Same-day call-outs across the region.</p></div></div>
+<div class="elementor-element elementor-widget elementor-widget-share-buttons"><div class="elementor-widget-container">
+<div class="elementor-share-buttons"><a href="#">Share on Facebook</a></div></div></div>
+</div></div></div></section></div>"""),
+    ("elementor nav menu", """<div class="elementor-widget-nav-menu"><div class="elementor-nav-menu--main">
+<a href="/a">Main menu link</a> <a href="/b">Other</a></div></div>
+<div class="elementor-widget-container hero-banner"><h1>We repair commercial refrigeration units</h1>
+<p>Same-day call-outs across the region.</p></div>"""),
+    ("gutenberg", """<main class="wp-block-group"><div class="entry-content wp-block-post-content">
+<div class="wp-block-cover hero-banner"><h1 class="wp-block-heading">We repair commercial refrigeration units</h1></div>
+<div class="wp-block-columns menu-pricing"><p>Same-day call-outs across the region.</p></div>
+<div class="wp-block-group social-proof"><p>Rated 4.9 by 300 customers.</p></div>
+<ul class="wp-block-social-links"><li><a href="#">Share on Facebook</a></li></ul>
+</div></main>"""),
+    ("divi", """<div id="et-main-area"><div id="main-content" class="has-sidebar"><div class="et_pb_section">
+<div class="et_pb_row"><div class="et_pb_module et_pb_text"><div class="et_pb_text_inner">
+<h2>We repair commercial refrigeration units</h2><p>Same-day call-outs across the region.</p></div></div></div>
+<div class="et_pb_module et_pb_social_media_follow"><a href="#">Share on Facebook</a></div></div>
+<div id="sidebar"><p>Main menu link</p></div></div></div>"""),
+    ("wpbakery", """<div class="vc_row wpb_row"><div class="wpb_column vc_column_container"><div class="vc_column-inner">
+<div class="wpb_wrapper"><div class="wpb_text_column wpb_content_element shared-content"><div class="wpb_wrapper">
+<h2>We repair commercial refrigeration units</h2><p>Same-day call-outs across the region.</p></div></div>
+<div class="addtoany_share_save_container"><a href="#">Share on Facebook</a></div></div></div></div></div>"""),
+    ("beaver builder", """<div class="fl-builder-content"><div class="fl-row fl-row-full-width"><div class="fl-row-content-wrap">
+<div class="fl-module fl-module-heading"><div class="fl-module-content"><h1 class="fl-heading">
+We repair commercial refrigeration units</h1></div></div>
+<div class="fl-module fl-module-rich-text"><div class="fl-rich-text"><p>Same-day call-outs across the region.</p></div></div>
+<div class="fl-module fl-module-menu"><nav><a href="/a">Main menu link</a></nav></div></div></div></div>"""),
+    ("content in a widget-area div", """<div class="widget-area sidebar-content"><h2>We repair commercial refrigeration units</h2>
+<p>Same-day call-outs across the region. Engineers carry common parts for most makes, so nine in ten
+faults are fixed on the first visit without a second trip.</p></div>"""),
+]
+
+def check_fixtures():
+    failed = 0
+    for name, body in FIXTURES:
+        text = extract_text(PAGE.format(body))
+        lost = [c for c in CONTENT if c not in text]
+        kept = [c for c in CHROME if c in text]
+        if lost or kept:
+            failed += 1
+            print(f"FAIL {name}: lost {lost}, kept chrome {kept}")
+    print(f"fixtures: {len(FIXTURES) - failed}/{len(FIXTURES)} ok")
+    return failed
+
+def legacy_text(html):
+    soup = BeautifulSoup(html, "lxml")
+    main = soup.body or soup
+    return md(str(main), strip=["script","style"])
+
+def load_pages(root, limit):
+    pages = []
+    for dirpath, _, files in os.walk(root):
+        for name in sorted(files):
+            path = os.path.join(dirpath, name)
+            if name.endswith(".gz"):
+                with gzip.open(path, "rt", encoding="utf-8", errors="ignore") as f:
+                    pages.append(f.read())
+            elif name.endswith((".html", ".htm")):
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    pages.append(f.read())
+            if len(pages) >= limit:
+                return pages
+    return pages
+
+def run(label, fn, pages):
+    t0 = time.perf_counter()
+    out = fn(pages)
+    dt = time.perf_counter() - t0
+    chars = sum(len(t) for t in out) / max(1, len(out))
+    print(f"{label:<28} {len(pages) / dt:8.1f} pages/s   avg {chars:8.0f} chars/page")
+    return dt
+
+def main():
+    args = sys.argv[1:]
+    if check_fixtures():
+        sys.exit(1)
+    limit = int(args[args.index("--limit") + 1]) if "--limit" in args else 2000
+    root = next((a for a in args if not a.startswith("--") and not a.isdigit()), PAGE_CACHE_DIR)
+    pages = load_pages(root, limit)
+    if not pages:
+        raise SystemExit(f"No pages found under {root}. Run crawler.py first or pass a directory.")
+    print(f"{len(pages)} pages from {root}")
+    old = run("bs4 + markdownify", lambda ps: [legacy_text(h) for h in ps], pages)
+    new = run("extract.py (1 process)", lambda ps: [extract_text(h) for h in ps], pages)
+    with ProcessPoolExecutor(max_workers=EXTRACT_WORKERS) as pool:
+        list(pool.map(len, [""] * EXTRACT_WORKERS))  # exclude worker start-up
+        par = run(f"extract.py ({EXTRACT_WORKERS} processes)", lambda ps: list(pool.map(extract_text, ps, chunksize=8)), pages)
+    print(f"speed-up: {old / new:.1f}x single process, {old / par:.1f}x pooled")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# bench_filters.py
+# Filtered search through the kb_filters bitmaps (FAISS IDSelectorBitmap) vs unfiltered
+# search and vs the over-fetch-and-drop alternative (SEARCH_OVERFETCH x k, then keep the
+# chunks that pass), for filters of different selectivity: p50 single-query latency and
+# recall@k against exact search over the matching chunks only. --synthetic N clustered
+# vectors (bench_ann.py) with Zipf-distributed tags, for each INDEX_TYPE:
+#   python bench_filters.py [--synthetic N] [--dim D] [--queries Q] [--k K] [--types flat,ivf,hnsw]
+import sys, time
+import numpy as np
+import faiss
+import ann
+import kb_filters
+from bench_ann import arg, normalize, synthetic
+from rag_store import SEARCH_OVERFETCH
+
+def p50_ms(fn, Q):
+    times = []
+    for q in Q:
+        t0 = time.perf_counter()
+        fn(q)
+        times.append(time.perf_counter() - t0)
+    return np.percentile(times, 50) * 1000
+
+def main():
+    args = sys.argv[1:]
+    n, k, nq = arg(args, "--synthetic", 100000), arg(args, "--k", 10), arg(args, "--queries", 300)
+    types = args[args.index("--types") + 1].split(",") if "--types" in args else ["flat", "ivf", "hnsw"]
+    rng = np.random.default_rng(0)
+    X = synthetic(n, arg(args, "--dim", 384), rng)
+    Q = normalize(X[rng.integers(0, n, nq)] + 0.05 * rng.standard_normal((nq, X.shape[1])).astype("float32"))
+    ids = np.arange(n)
+    # tag t on ~1/(t+1)^1.5 of the chunks; 20 URL directories
+    tags = {f"t{t}": rng.random(n) < 0.5 / (t + 1) ** 1.5 for t in range(8)}
+    dirs = rng.integers(0, 20, n)
+    docs = {int(i): ([t for t, on in tags.items() if on[i]], [f"https://site/d{dirs[i]}/p{i}"]) for i in ids}
+    t0 = time.perf_counter()
+    fi = kb_filters.FilterIndex(*kb_filters.build(docs))
+    print(f"{n} vectors, bitmaps for {len(fi.tags)} tags + {len(fi.prefixes)} prefixes "
+          f"({fi.bits.nbytes / 1e6:.1f} MB) built in {time.perf_counter() - t0:.1f}s; top-{k}, {nq} queries")
+    filters = [{"tags": "t0"}, {"tags": "t2"}, {"tags": "t7"}, {"url_prefix": "/d3"}, {"tags": "t1", "url_prefix": "/d3"}]
+    for index_type in types:
+        p = ann.index_params(n, X.shape[1], index_type, "fp32")
+        index = ann.build_index(X, ids, p)
+        print(f"\n{ann.factory_string(p)}")
+        base = p50_ms(lambda q: index.search(q[None], k), Q)
+        print(f"  {'unfiltered':<28} p50 {base:7.3f} ms")
+        for f in filters:
+            bitmap = fi.bitmap(f)
+            mask = kb_filters.allowed(bitmap, ids)
+            sub = np.flatnonzero(mask)
+            exact = faiss.IndexFlatIP(X.shape[1])
+            exact.add(X[sub])
+            truth = sub[exact.search(Q, k)[1]]
+            sel = kb_filters.selector(bitmap)
+            found = [ann.search(index, p, q[None], k, sel, mask.mean())[1][0] for q in Q]
+            sel_ms = p50_ms(lambda q: ann.search(index, p, q[None], k, sel, mask.mean()), Q)
+
+            def post(q):
+                I = index.search(q[None], k * SEARCH_OVERFETCH)[1][0]
+                return I[(I >= 0) & mask[I.clip(0)]][:k]
+            dropped = [post(q) for q in Q]
+            post_ms = p50_ms(post, Q)
+            recall = lambda res: np.mean([np.isin(r, t).sum() / k for r, t in zip(res, truth)])
+            print(f"  {str(f):<28} {mask.mean():6.1%} of chunks   bitmap p50 {sel_ms:7.3f} ms recall {recall(found):.3f}"
+                  f"   over-fetch x{SEARCH_OVERFETCH} p50 {post_ms:7.3f} ms recall {recall(dropped):.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# bench_keywords.py
+# Old substring tag_chunk / route_intent vs the compiled keywords.py matchers over every
+# chunk in the live KB: chunks/s, and how many chunks each tag (intent) was given by
+# each. Differences are mostly substring hits the old code made inside other words
+# ("cost" in "costume", "where" in "elsewhere"); a few examples are printed.
+#   python bench_keywords.py [--repeat N]
+import os, sys, time
+import kb_versions
+import keywords
+from docstore import DocStore, DOCSTORE_FILE
+
+KB_DIR = os.environ.get("KB_DIR", "kb")
+
+def legacy_tag_chunk(text):
+    # curate.tag_chunk before keywords.py
+    tl = text.lower()
+    tags=[]
+    if any(k in tl for k in ["service","offer","solution","we provide"]): tags.append("services")
+    if any(k in tl for k in ["price","pricing","cost","quote"]): tags.append("pricing")
+    if any(k in tl for k in ["contact","address","phone","email","location"]): tags.append("contact")
+    if any(k in tl for k in ["faq","frequently asked"]): tags.append("faq")
+    if not tags: tags.append("general")
+    return tags
+
+def legacy_intent(text):
+    # the keyword part of agents.route_intent before keywords.py
+    t = text.lower()
+    for label, words in keywords.INTENTS.items():
+        if any(k in t for k in words):
+            return label
+    return None
+
+def load_chunks():
+    path = kb_versions.active_dir(KB_DIR)
+    if path is None or not os.path.exists(os.path.join(path, DOCSTORE_FILE)):
+        return []
+    store = DocStore(os.path.join(path, DOCSTORE_FILE))
+    texts = [r[0] for r in store.db.execute("SELECT content FROM docs")]
+    store.close()
+    return texts
+
+def run(label, fn, texts, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = [fn(t) for t in texts]
+    dt = time.perf_counter() - t0
+    print(f"{label:<28} {len(texts) * repeat / dt:10.0f} chunks/s")
+    return out
+
+def compare(name, old, new, texts):
+    counts = {}
+    for o, n in zip(old, new):
+        for l in set(o if isinstance(o, list) else [o]) | set(n if isinstance(n, list) else [n]):
+            c = counts.setdefault(l, [0, 0])
+            c[0] += l in (o if isinstance(o, list) else [o])
+            c[1] += l in (n if isinstance(n, list) else [n])
+    differ = [i for i, (o, n) in enumerate(zip(old, new)) if o != n]
+    print(f"{name}: {len(differ)} of {len(texts)} chunks differ")
+    for l, (o, n) in sorted(counts.items(), key=lambda x: str(x[0])):
+        print(f"  {str(l):<20} old {o:7d}   new {n:7d}")
+    for i in differ[:3]:
+        print(f"  e.g. {old[i]} -> {new[i]}: {texts[i][:100]!r}")
+
+def main():
+    args = sys.argv[1:]
+    repeat = int(args[args.index("--repeat") + 1]) if "--repeat" in args else 3
+    texts = load_chunks()
+    if not texts:
+        raise SystemExit("No chunks. Build the KB with curate.py first.")
+    print(f"{len(texts)} chunks from {KB_DIR}, {sum(map(len, texts)) / len(texts):.0f} chars avg, x{repeat}")
+    tags, intents = keywords.tag_matcher(), keywords.intent_matcher()
+    old_tags = run("tag_chunk (substring)", legacy_tag_chunk, texts, repeat)
+    new_tags = run("tag_chunk (keywords.py)", lambda t: tags.labels(t) or ["general"], texts, repeat)
+    old_int = run("route_intent (substring)", legacy_intent, texts, repeat)
+    new_int = run("route_intent (keywords.py)", intents.first, texts, repeat)
+    compare("tags", old_tags, new_tags, texts)
+    compare("intents", old_int, new_int, texts)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# bench_search.py
+# Queries/sec of RAGStore.search() in a loop vs search_many() over the same queries,
+# with the query cache off so every query is encoded, and whether both return the same
+# hits. Queries come from a file (one per line, e.g. the question log), or are word
+# windows sampled from KB chunks:
+#   python bench_search.py [queries.txt] [--queries N] [--k K] [--batch B]
+import sys, time, random
+from rag_store import RAGStore, QueryCache
+
+def sample_queries(store, n, rng):
+    rows = store.docstore.db.execute("SELECT content FROM docs LIMIT 5000")
+    texts = [t for t in (r[0].split() for r in rows) if len(t) >= 4]
+    out = []
+    for _ in range(n):
+        words = rng.choice(texts)
+        size = rng.randint(3, min(12, len(words)))
+        start = rng.randrange(0, len(words) - size + 1)
+        out.append(" ".join(words[start:start + size]))
+    return out
+
+def main():
+    args = sys.argv[1:]
+    opt = lambda name, default: int(args[args.index(name) + 1]) if name in args else default
+    n, k, batch = opt("--queries", 500), opt("--k", 6), opt("--batch", 0)
+    path = next((a for i, a in enumerate(args)
+                 if not a.startswith("--") and (i == 0 or args[i - 1] not in ("--queries", "--k", "--batch"))), None)
+    store = RAGStore()
+    if store.docstore is None or store.index.ntotal == 0:
+        raise SystemExit("Empty KB. Build it with curate.py first.")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            queries = [l.strip() for l in f if l.strip()][:n]
+    else:
+        queries = sample_queries(store, n, random.Random(0))
+    store.search_many(queries[:8], k)  # load the model / index pages before timing
+    print(f"{len(queries)} queries, top-{k}, KB version {store.version or '-'}, "
+          f"{store.index.ntotal} chunks ({type(store.index).__name__})")
+
+    store.query_cache = QueryCache(0)
+    t0 = time.perf_counter()
+    looped = [store.search(q, k) for q in queries]
+    loop_s = time.perf_counter() - t0
+
+    store.query_cache = QueryCache(0)
+    step = batch or len(queries)
+    t0 = time.perf_counter()
+    batched = [h for i in range(0, len(queries), step) for h in store.search_many(queries[i:i + step], k)]
+    batch_s = time.perf_counter() - t0
+
+    same = sum([h.id for h in a] == [h.id for h in b] for a, b in zip(looped, batched))
+    print(f"{'search() loop':<22} {len(queries) / loop_s:9.1f} queries/s")
+    print(f"{'search_many()':<22} {len(queries) / batch_s:9.1f} queries/s  (batch {step}, "
+          f"{loop_s / batch_s:.1f}x)")
+    print(f"identical hit lists: {same}/{len(queries)}")
+
+if __name__ == "__main__":
+    main()
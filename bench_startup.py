@@ -0,0 +1,56 @@
+# bench_startup.py
+# Cold-start times, each in a fresh interpreter: `import agents`, the first rendered run
+# of streamlit_app.py (Streamlit's AppTest, no server), and time until the RAGStore is
+# ready, with the per-phase report from startup.py. Run from the app directory, with
+# the KB built:
+#   python bench_startup.py [--repeat N]
+import os, sys, json, subprocess
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT = """
+import time; t = time.perf_counter()
+import agents
+print(json.dumps({"import agents": time.perf_counter() - t}))
+"""
+PAGE = """
+import time; t = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(os.path.join(HERE, "streamlit_app.py"), default_timeout=300)
+at.run()
+page = time.perf_counter() - t
+import agents
+while not agents.rag_ready():
+    time.sleep(0.02)
+print(json.dumps({"first page render": page, "page + RAGStore ready": time.perf_counter() - t,
+                  "errors": len(at.exception)}))
+"""
+RAG = """
+import startup, agents
+agents.get_rag()
+print(json.dumps({name: secs for name, secs, _ in startup.report()}))
+"""
+
+def run(code):
+    out = subprocess.run([sys.executable, "-c", f"import os, sys, json\nHERE = {HERE!r}\nsys.path.insert(0, HERE)\n{code}"],
+                         capture_output=True, text=True)
+    lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+    if out.returncode or not lines:
+        raise SystemExit(f"failed:\n{out.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+def main():
+    args = sys.argv[1:]
+    repeat = int(args[args.index("--repeat") + 1]) if "--repeat" in args else 1
+    results = {}
+    for _ in range(repeat):
+        for code in (IMPORT, PAGE, RAG):
+            for name, secs in run(code).items():
+                results.setdefault(name, []).append(secs)
+    for name, values in results.items():
+        value = f"{np.median(values):8.2f}s" if name != "errors" else f"{int(max(values)):8d}"
+        print(f"{name:<34} {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# check_embedder.py
+# Each EMB_BACKEND against torch on the same texts: model load time, peak RSS, single-query
+# encode p50/p99, batch throughput, and parity: cosine of every embedding with its torch
+# embedding and top-k overlap of query -> chunk search. Every backend runs in a fresh
+# interpreter so load time and RSS are its own. Texts are KB chunks, queries are word
+# windows from them. Exits non-zero when a cosine drops below EMB_PARITY_MIN_COS.
+#   python check_embedder.py [--backend int8|onnx] [--texts N] [--queries Q] [--k K]
+import os, sys, json, random, tempfile, subprocess
+import numpy as np
+import kb_versions
+from docstore import DocStore, DOCSTORE_FILE
+from embedder import EMB_MODEL, EMB_THREADS, EMB_PARITY_MIN_COS, BACKENDS
+
+KB_DIR = os.environ.get("KB_DIR", "kb")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+RUN = """
+import os, sys, json, time, resource
+import numpy as np
+sys.path.insert(0, HERE)
+t = time.perf_counter()
+import embedder
+emb = embedder.Embedder(embedder.EMB_MODEL, BACKEND, embedder.EMB_THREADS)
+load = time.perf_counter() - t
+with open(os.path.join(TMP, "texts.json"), encoding="utf-8") as f:
+    texts, queries = json.load(f)
+emb.encode(queries[:4])  # first-call allocations out of the timings
+lat = []
+for q in queries:
+    t = time.perf_counter()
+    emb.encode([q])
+    lat.append(time.perf_counter() - t)
+t = time.perf_counter()
+D = emb.encode(texts)
+batch = time.perf_counter() - t
+np.save(os.path.join(TMP, BACKEND + "_docs.npy"), D)
+np.save(os.path.join(TMP, BACKEND + "_queries.npy"), emb.encode(queries, batch_size=1))
+print(json.dumps({"load s": load, "peak RSS MB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "query p50 ms": 1000 * float(np.percentile(lat, 50)),
+                  "query p99 ms": 1000 * float(np.percentile(lat, 99)),
+                  "texts/s": len(texts) / batch}))
+"""
+
+def arg(args, name, default):
+    return args[args.index(name) + 1] if name in args else default
+
+def kb_texts(n):
+    path = kb_versions.active_dir(KB_DIR)
+    if path is None or not os.path.exists(os.path.join(path, DOCSTORE_FILE)):
+        raise SystemExit("Empty KB. Build it with curate.py first.")
+    store = DocStore(os.path.join(path, DOCSTORE_FILE))
+    texts = [r[0] for r in store.db.execute("SELECT content FROM docs LIMIT ?", (n,))]
+    store.close()
+    return texts
+
+def word_windows(texts, n, rng):
+    words = [t.split() for t in texts if len(t.split()) >= 4]
+    out = []
+    for _ in range(n):
+        w = rng.choice(words)
+        size = rng.randint(3, min(12, len(w)))
+        start = rng.randrange(0, len(w) - size + 1)
+        out.append(" ".join(w[start:start + size]))
+    return out
+
+def run(backend, tmp):
+    code = f"HERE, TMP, BACKEND = {HERE!r}, {tmp!r}, {backend!r}\n{RUN}"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+    if out.returncode or not lines:
+        last = (out.stderr.strip().splitlines() or ["no output"])[-1]
+        print(f"{backend:<6} failed: {last}")
+        return None
+    return json.loads(lines[-1])
+
+def main():
+    args = sys.argv[1:]
+    n, nq, k = int(arg(args, "--texts", 1000)), int(arg(args, "--queries", 200)), int(arg(args, "--k", 10))
+    backends = ["torch"] + ([arg(args, "--backend", "")] if "--backend" in args else [b for b in BACKENDS if b != "torch"])
+    texts = kb_texts(n)
+    queries = word_windows(texts, nq, random.Random(0))
+    print(f"{EMB_MODEL}: {len(texts)} chunks, {len(queries)} queries, top-{k}, "
+          f"EMB_THREADS={EMB_THREADS or 'default'}, min cosine {EMB_PARITY_MIN_COS}")
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "texts.json"), "w", encoding="utf-8") as f:
+            json.dump([texts, queries], f)
+        base = None
+        for backend in backends:
+            stats = run(backend, tmp)
+            if stats is None:
+                # onnx needs optimum[onnxruntime]: only a failure when asked for by name
+                ok = ok and backend == "onnx" and "--backend" not in args
+                if backend == "torch":
+                    break
+                continue
+            D = np.load(os.path.join(tmp, backend + "_docs.npy"))
+            Q = np.load(os.path.join(tmp, backend + "_queries.npy"))
+            line = f"{backend:<6} " + "  ".join(f"{name} {value:8.1f}" for name, value in stats.items())
+            if base is None:
+                base = D, Q, np.argsort(-(Q @ D.T), axis=1)[:, :k]
+                print(line)
+                continue
+            cos = np.concatenate([(D * base[0]).sum(1), (Q * base[1]).sum(1)])
+            top = np.argsort(-(Q @ D.T), axis=1)[:, :k]
+            overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, base[2])])
+            good = cos.min() >= EMB_PARITY_MIN_COS
+            ok = ok and good
+            print(f"{line}  cosine min {cos.min():.4f} mean {cos.mean():.4f}  "
+                  f"top-{k} overlap {overlap:.3f}  {'ok' if good else 'DRIFT'}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
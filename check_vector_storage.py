@@ -0,0 +1,61 @@
+# check_vector_storage.py
+# Top-k parity of float16 / int8 vector storage against the float32 index of the same
+# INDEX_TYPE, searched through a memory-mapped copy the way RAGStore loads it. Exits
+# non-zero when the mean top-k overlap drops below PARITY_MIN_OVERLAP or a returned
+# score drifts from its exact float32 score by more than the storage's tolerance
+# (PARITY_TOL_FP16 / PARITY_TOL_INT8).
+#   python check_vector_storage.py [--synthetic N] [--dim D] [--queries Q] [--k K]
+import os, sys, tempfile
+import numpy as np
+import faiss
+import ann
+from bench_ann import arg, normalize, kb_vectors, synthetic, KB_DIR, EMB_MODEL
+
+PARITY_MIN_OVERLAP = float(os.environ.get("PARITY_MIN_OVERLAP", "0.95"))
+SCORE_TOLERANCE = {"fp16": float(os.environ.get("PARITY_TOL_FP16", "0.002")),
+                   "int8": float(os.environ.get("PARITY_TOL_INT8", "0.03"))}
+
+def mapped_search(index, p, Q, k, tmpdir):
+    path = os.path.join(tmpdir, f"{p['type']}_{p['storage']}.index")
+    faiss.write_index(index, path)
+    mapped = ann.configure(ann.read_index(path, p, mmap=True), p)
+    return mapped.search(Q, k), os.path.getsize(path)
+
+def main():
+    args = sys.argv[1:]
+    k, nq = arg(args, "--k", 10), arg(args, "--queries", 500)
+    rng = np.random.default_rng(0)
+    if "--synthetic" in args:
+        X, source = synthetic(arg(args, "--synthetic", 50000), arg(args, "--dim", 384), rng), "synthetic"
+    else:
+        X, source = kb_vectors(), f"{KB_DIR} ({EMB_MODEL})"
+    if len(X) == 0:
+        raise SystemExit("No vectors. Build the KB with curate.py first, or pass --synthetic N.")
+    index_type = ann.INDEX_TYPE if ann.INDEX_TYPE != "ivfpq" else "ivf"  # PQ has no fp32 twin
+    Q = normalize(X[rng.integers(0, len(X), nq)] + 0.05 * rng.standard_normal((nq, X.shape[1])).astype("float32"))
+    ids = np.arange(len(X))
+    print(f"{len(X)} vectors x {X.shape[1]} dims from {source}; INDEX_TYPE={index_type}, "
+          f"{nq} queries, top-{k} vs float32 (mmap-loaded)")
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        base_p = ann.index_params(len(X), X.shape[1], index_type, "fp32")
+        (_, base), base_size = mapped_search(ann.build_index(X, ids, base_p), base_p, Q, k, tmp)
+        kth = np.einsum("qkd,qd->qk", X[np.clip(base, 0, None)], Q)[:, -1:]
+        print(f"{'storage':<8} {'size MB':>8} {'overlap':>8} {'max |score err|':>16}  result")
+        print(f"{'fp32':<8} {base_size / 1e6:8.2f} {1.0:8.3f} {0.0:16.5f}  baseline")
+        for storage in ("fp16", "int8"):
+            p = ann.index_params(len(X), X.shape[1], index_type, storage)
+            (D, I), size = mapped_search(ann.build_index(X, ids, p), p, Q, k, tmp)
+            exact = np.einsum("qkd,qd->qk", X[np.clip(I, 0, None)], Q)
+            # a hit matches when its exact score is within tolerance of the float32 k-th best,
+            # so (near-)duplicate chunks swapping places at the cut-off are not misses
+            overlap = np.mean(((exact >= kth - SCORE_TOLERANCE[storage]) & (I >= 0)).sum(axis=1) / k)
+            err = float(np.abs(np.where(I >= 0, D - exact, 0)).max())
+            ok = overlap >= PARITY_MIN_OVERLAP and err <= SCORE_TOLERANCE[storage]
+            failed |= not ok
+            print(f"{storage:<8} {size / 1e6:8.2f} {overlap:8.3f} {err:16.5f}  "
+                  f"{'ok' if ok else 'FAIL'} (min overlap {PARITY_MIN_OVERLAP}, tol {SCORE_TOLERANCE[storage]})")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
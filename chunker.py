@@ -0,0 +1,168 @@
+# chunker.py
+import os, re, json, bisect
+from nltk import sent_tokenize
+
+EMB_MODEL = os.environ.get("EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "40"))
+_HEADING = re.compile(r"^#{1,6} \S")
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]", re.U)
+_tokenizer = None
+
+class _ApproxTokenizer:
+    # Used when the model's tokenizer cannot be loaded: words and punctuation, with
+    # long words counted as several pieces the way WordPiece would split them.
+    model_max_length = CHUNK_TOKENS
+
+    def count(self, texts):
+        return [sum(1 + len(t) // 8 for t in _APPROX_TOKEN.findall(s)) for s in texts]
+
+    def split(self, text, budget):
+        spans = [m.span() for m in _APPROX_TOKEN.finditer(text)]
+        return [text[spans[i][0]:spans[min(i + budget, len(spans)) - 1][1]] for i in range(0, len(spans), budget)]
+
+    def specials(self):
+        return 0
+
+class _HFTokenizer:
+    def __init__(self, tok, max_length=None):
+        self.tok = tok
+        self.model_max_length = min(tok.model_max_length, max_length or tok.model_max_length)
+
+    def count(self, texts):
+        if not texts:
+            return []
+        ids = self.tok(texts, add_special_tokens=False, truncation=False)["input_ids"]
+        return [len(i) for i in ids]
+
+    def split(self, text, budget):
+        # Cut an over-long sentence every `budget` tokens, backing up to whitespace so
+        # words are not split between pieces.
+        offsets = self.tok(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        starts = [o[0] for o in offsets]
+        pieces, start, ti = [], 0, 0
+        while ti + budget < len(starts):
+            cut = starts[ti + budget]
+            space = text.rfind(" ", start, cut + 1)
+            cut = space if space > start else cut
+            pieces.append(text[start:cut].strip())
+            start, ti = cut, bisect.bisect_left(starts, cut)
+        pieces.append(text[start:].strip())
+        return [p for p in pieces if p]
+
+    def specials(self):
+        return self.tok.num_special_tokens_to_add()
+
+def max_seq_length(emb_model=EMB_MODEL):
+    # What the SentenceTransformer truncates its input to (sentence_bert_config.json).
+    # It can be well below the tokenizer's model_max_length: 128 vs 512 for
+    # paraphrase-multilingual-MiniLM-L12-v2. None when the model does not say.
+    try:
+        path = os.path.join(emb_model, "sentence_bert_config.json")
+        if not os.path.isdir(emb_model):
+            from huggingface_hub import hf_hub_download
+            path = hf_hub_download(emb_model, "sentence_bert_config.json")
+        with open(path, "r", encoding="utf-8") as f:
+            return int(json.load(f)["max_seq_length"])
+    except Exception:
+        return None
+
+def tokenizer(emb_model=EMB_MODEL):
+    # The embedding model's own tokenizer, loaded once per process (extraction workers
+    # included), with model_max_length capped at the model's max_seq_length.
+    global _tokenizer
+    if _tokenizer is None:
+        limit = max_seq_length(emb_model)
+        try:
+            from transformers import AutoTokenizer
+            _tokenizer = _HFTokenizer(AutoTokenizer.from_pretrained(emb_model), limit)
+        except Exception:
+            _tokenizer = _ApproxTokenizer()
+            _tokenizer.model_max_length = min(CHUNK_TOKENS, limit or CHUNK_TOKENS)
+    return _tokenizer
+
+def token_budget(tok=None, max_tokens=CHUNK_TOKENS):
+    # Tokens left for text once [CLS]/[SEP] are added, capped by what the model accepts.
+    tok = tok or tokenizer()
+    return max(16, min(max_tokens, tok.model_max_length) - tok.specials())
+
+def _sections(text):
+    # Markdown from extract.py -> [(heading or "", [block, ...])]; a heading starts a section.
+    sections, heading, blocks = [], "", []
+    for block in text.split("\n\n"):
+        block = block.strip()
+        if not block:
+            continue
+        if _HEADING.match(block) and "\n" not in block:
+            if blocks or heading:
+                sections.append((heading, blocks))
+            heading, blocks = block, []
+        else:
+            blocks.append(block)
+    if blocks or heading:
+        sections.append((heading, blocks))
+    return sections
+
+def _units(blocks):
+    # Sentences of prose blocks; code blocks, tables and lists split per line instead.
+    # Yields (separator to put before it, text).
+    for block in blocks:
+        if block.startswith("```") or "\n" in block:
+            lines = [l for l in block.split("\n") if l.strip()]
+        else:
+            lines = sent_tokenize(block)
+        for i, line in enumerate(lines):
+            yield ("\n\n" if i == 0 else ("\n" if "\n" in block else " ")), line
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, tok=None):
+    # Pack whole sentences into chunks of at most `max_tokens` model tokens. Chunks never
+    # span two sections; a section's heading leads each of its chunks, and consecutive
+    # chunks of a section share their last sentences up to `overlap_tokens`. Every
+    # sentence is tokenized once, in one batch per page, so this is linear in the text.
+    tok = tok or tokenizer()
+    budget = token_budget(tok, max_tokens)
+    chunks, lone = [], []
+    for heading, blocks in _sections(text):
+        if not blocks:  # heading directly followed by a sub-heading: keep it as context
+            lone.append(heading)
+            continue
+        heading = "\n".join(lone + [heading]) if heading else "\n".join(lone)
+        lone = []
+        units = list(_units(blocks))
+        counts = tok.count([heading] + [u for _, u in units])
+        head_tokens, counts = counts[0], counts[1:]
+        if head_tokens > budget // 4:  # too long to repeat on every chunk: goes in once, as text
+            units.insert(0, ("\n\n", heading))
+            counts.insert(0, head_tokens)
+            heading, head_tokens = "", 0
+        room = budget - head_tokens
+        parts = []
+        for (sep, u), n in zip(units, counts):
+            if n <= room:
+                parts.append((sep, u, n))
+                continue
+            pieces = tok.split(u, room)
+            for j, (piece, c) in enumerate(zip(pieces, tok.count(pieces))):
+                parts.append((sep if j == 0 else " ", piece, c))
+        cur, used = [], 0
+        def emit():
+            body = "".join((sep if k else "") + u for k, (sep, u, _) in enumerate(cur)).strip()
+            chunks.append(f"{heading}\n\n{body}" if heading else body)
+        for part in parts:
+            if cur and used + part[2] > room:
+                emit()
+                # carry the trailing sentences (up to overlap_tokens) into the next chunk
+                keep, kept = [], 0
+                for prev in reversed(cur[1:]):
+                    if kept + prev[2] > overlap_tokens or kept + prev[2] + part[2] > room:
+                        break
+                    keep.append(prev)
+                    kept += prev[2]
+                cur, used = keep[::-1], kept
+            cur.append(part)
+            used += part[2]
+        if cur:
+            emit()
+    if lone:
+        chunks.append("\n".join(lone))
+    return chunks
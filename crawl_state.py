@@ -0,0 +1,158 @@
+# crawl_state.py
+import os, json, time, sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    fetched_at REAL,
+    status INTEGER,
+    title TEXT,
+    outlinks TEXT,
+    canonical TEXT,
+    simhash TEXT
+)
+"""
+COLUMNS = ("url", "etag", "last_modified", "content_hash", "fetched_at", "status", "title", "outlinks", "canonical", "simhash")
+
+class CrawlState:
+    # Per-URL validators and last known content, kept between crawler runs.
+    # Only touched from the crawler's event-loop thread.
+    def __init__(self, path, commit_every=50):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+        have = {r[1] for r in self.db.execute("PRAGMA table_info(pages)")}
+        for col in COLUMNS:
+            if col not in have:  # state files from older crawler versions
+                self.db.execute(f"ALTER TABLE pages ADD COLUMN {col} TEXT")
+        self.commit_every = commit_every
+        self._dirty = 0
+
+    def get(self, url):
+        row = self.db.execute(f"SELECT {', '.join(COLUMNS)} FROM pages WHERE url=?", (url,)).fetchone()
+        if not row:
+            return None
+        rec = dict(zip(COLUMNS, row))
+        rec["outlinks"] = json.loads(rec["outlinks"] or "[]")
+        rec["simhash"] = int(rec["simhash"] or "0", 16)
+        return rec
+
+    def conditional_headers(self, prev):
+        headers = {}
+        if prev:
+            if prev.get("etag"):
+                headers["If-None-Match"] = prev["etag"]
+            if prev.get("last_modified"):
+                headers["If-Modified-Since"] = prev["last_modified"]
+        return headers
+
+    def put(self, url, etag, last_modified, content_hash, status, title, outlinks, canonical=None, simhash=0):
+        self.db.execute(
+            f"INSERT OR REPLACE INTO pages ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            (url, etag, last_modified, content_hash, time.time(), status, title, json.dumps(outlinks),
+             canonical, f"{simhash:016x}"))
+        self._tick()
+
+    def touch(self, url):
+        self.db.execute("UPDATE pages SET fetched_at=? WHERE url=?", (time.time(), url))
+        self._tick()
+
+    def urls(self):
+        return [r[0] for r in self.db.execute("SELECT url FROM pages")]
+
+    def remove(self, urls):
+        self.db.executemany("DELETE FROM pages WHERE url=?", [(u,) for u in urls])
+        self._tick()
+
+    def _tick(self):
+        self._dirty += 1
+        if self._dirty >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self._dirty = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+def write_json_atomic(path, obj, **kw):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, **kw)
+    os.replace(tmp, path)
+
+def write_delta(path, delta):
+    write_json_atomic(path, {k: sorted(v) for k, v in delta.items()}, indent=2)
+
+class ReportWriter:
+    # Append-only JSONL crawl report. Records are flushed as they complete so an
+    # interrupted crawl keeps everything it finished; publish() renames the
+    # .partial file into place once the crawl is done.
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.partial = path + ".partial"
+        if resume and os.path.exists(self.partial):
+            self._drop_torn_tail()
+            self.f = open(self.partial, "a", encoding="utf-8")
+        else:
+            self.f = open(self.partial, "w", encoding="utf-8")
+
+    def _drop_torn_tail(self):
+        # A crash mid-write can leave half a line at the end; cut back to the last newline.
+        with open(self.partial, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def records(self):
+        self.f.flush()
+        return iter_report(self.partial)
+
+    def write(self, rec):
+        self.f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self.f.flush()
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def publish(self):
+        self.f.close()
+        os.replace(self.partial, self.path)
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+def iter_report(path):
+    # Lazily yield page records from a JSONL report (or a legacy JSON array report).
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+def save_checkpoint(path, depth_map, pending, retries, sitemap=None):
+    write_json_atomic(path, {"saved_at": time.time(), "depth_map": depth_map,
+                             "pending": sorted(pending), "retries": retries, "sitemap": sitemap or {}})
+
+def load_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
@@ -1,112 +1,294 @@
 # crawler.py
-import os, time, re, json, hashlib, urllib.robotparser
+import os, sys, time, asyncio, itertools
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, urlparse
 import requests
-from bs4 import BeautifulSoup
-from markdownify import markdownify as md
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from politeness import Politeness, USER_AGENT, BACKOFF_STATUSES
+from crawl_state import CrawlState, ReportWriter, write_delta, save_checkpoint, load_checkpoint
+from page_cache import PageCache
+import sitemaps
+from urlnorm import canonicalize, url_key
+from dedup import simhash, SimHashIndex
+from extract import extract, process_pool, shutdown_pool
+from refresh_jobs import progress
 
 SITE_ROOT = os.environ.get("SITE_ROOT", "https://harrissces.com/")
 OUTPUT_DIR = os.path.join(os.environ.get("KB_DIR", "kb"))
 CRAWL_DEPTH = int(os.environ.get("CRAWL_DEPTH", "3"))
-RATE_LIMIT = float(os.environ.get("RATE_LIMIT_RPS", "1.0"))
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", "8"))
+MAX_RETRIES = int(os.environ.get("CRAWL_MAX_RETRIES", "3"))
+CHECKPOINT_EVERY = int(os.environ.get("CRAWL_CHECKPOINT_EVERY", "50"))
+CHECKPOINT_SECS = float(os.environ.get("CRAWL_CHECKPOINT_SECS", "30"))
+REPORT_PATH = os.path.join(OUTPUT_DIR, "crawl_report.jsonl")
 ALLOW_DOMAINS = {urlparse(SITE_ROOT).netloc}
 
 def now_iso(): return time.strftime("%Y-%m-%d")
 
-def polite_get(session, url):
-    time.sleep(1.0 / RATE_LIMIT)
-    return session.get(url, timeout=20, headers={"User-Agent":"harriss-autobot/1.0"})
+def make_session(pool_size=CRAWL_CONCURRENCY):
+    # One keep-alive pool shared by all workers; requests decodes gzip/deflate transparently.
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"})
+    return session
 
-def allowed_by_robots(url):
-    root = f"{urlparse(SITE_ROOT).scheme}://{urlparse(SITE_ROOT).netloc}"
-    rp = urllib.robotparser.RobotFileParser()
-    try:
-        rp.set_url(urljoin(root, "/robots.txt"))
-        rp.read()
-        return rp.can_fetch("*", url)
-    except Exception:
-        return True
+async def polite_get(session, throttle, url, headers=None):
+    delay = throttle.reserve()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    t0 = time.monotonic()
+    r = await asyncio.to_thread(session.get, url, timeout=20, headers=headers)
+    throttle.record(time.monotonic() - t0, r.status_code, r.headers.get("Retry-After"))
+    return r
 
 def is_in_scope(url):
     p = urlparse(url)
     return p.scheme in ("http","https") and p.netloc in ALLOW_DOMAINS
 
-def extract_title(soup):
-    if soup.title and soup.title.string:
-        return soup.title.string.strip()
-    h1 = soup.find("h1")
-    return h1.get_text(strip=True) if h1 else ""
-
-def clean_html(html):
-    return md(html, strip=["script","style"])
-
 def hash_text(s):
     import hashlib
     return hashlib.sha256(s.encode("utf-8", errors="ignore")).hexdigest()
 
-def discover_from_sitemap(session):
-    urls = set()
-    for path in ["/sitemap.xml", "/sitemap_index.xml"]:
-        sm = urljoin(SITE_ROOT, path)
-        try:
-            r = session.get(sm, timeout=15)
-            if r.status_code == 200:
-                for loc in re.findall(r"<loc>(.*?)</loc>", r.text, flags=re.I):
-                    if is_in_scope(loc): urls.add(loc.strip())
-        except Exception:
-            pass
-    return urls
-
-def crawl():
+def discover_from_sitemap(session, politeness):
+    # Sitemaps announced in robots.txt plus the two conventional locations.
+    candidates = politeness.robots.sitemaps(SITE_ROOT) + [urljoin(SITE_ROOT, p) for p in ("/sitemap.xml", "/sitemap_index.xml")]
+    found = sitemaps.discover(session, list(dict.fromkeys(candidates)), is_in_scope)
+    return {canonicalize(u): meta for u, meta in found.items()}
+
+def page_record(url, status, title, last_modified, chash, outlinks, shash=0):
+    return {
+        "url": url,
+        "status": status,
+        "title": title,
+        "last_modified": last_modified,
+        "discovered_at": now_iso(),
+        "content_hash": chash,
+        "simhash": f"{shash:016x}",
+        "outlinks": sorted(set(outlinks))
+    }
+
+def parse_page(url, html):
+    # Runs in the extraction process pool. url is the final (post-redirect) address when
+    # that is in scope, else the requested one; it is also the canonical unless the page
+    # declares an in-scope <link rel=canonical>.
+    page = extract(html)
+    outlinks = set()
+    for href in page["links"]:
+        href = canonicalize(urljoin(url, href))
+        if is_in_scope(href):
+            outlinks.add(href)
+    canonical = canonicalize(url)
+    if page["canonical"]:
+        href = canonicalize(urljoin(url, page["canonical"]))
+        if is_in_scope(href):
+            canonical = href
+    return {"title": page["title"], "content_hash": hash_text(page["text"]), "outlinks": sorted(outlinks),
+            "canonical": canonical, "simhash": simhash(page["text"])}
+
+async def _crawl_async(resume=False):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=CRAWL_CONCURRENCY))
+    session = make_session()
+    politeness = Politeness(session)
+    state = CrawlState(os.path.join(OUTPUT_DIR, "crawl_state.sqlite"))
+    cache = PageCache()
+    checkpoint_path = os.path.join(OUTPUT_DIR, "crawl_checkpoint.json")
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    report = ReportWriter(REPORT_PATH, resume=checkpoint is not None)
+    queue = asyncio.PriorityQueue()
+    seq = itertools.count()
+    depth_map, pending, retries, sitemap_meta = {}, set(), {}, {}
+    done, live_hashes = set(), set()  # only urls/hashes are held in memory, records go to disk
+    kept = set()  # fetched urls whose state row stays, whether emitted or folded into another page
+    aliases = {}  # url_key -> the spelling of that url we crawl under
+    dups = SimHashIndex()
+    delta = {"added": set(), "changed": set(), "unchanged": set(), "removed": set(), "duplicate": set()}
+    pbar = tqdm(total=0, desc="Crawling")
+    last_checkpoint = [time.monotonic(), 0]
+
+    def push(u):
+        pending.add(u)
+        lastmod, priority = sitemap_meta.get(u, (None, None))
+        queue.put_nowait((sitemaps.crawl_priority(depth_map[u], lastmod, priority), next(seq), u))
+        pbar.total += 1
+
+    def enqueue(u, depth):
+        if depth > CRAWL_DEPTH:
+            return
+        u = canonicalize(u)
+        u = aliases.setdefault(url_key(u), u)
+        known = depth_map.get(u)
+        if known is None:
+            depth_map[u] = depth
+            push(u)
+        elif depth < known:
+            # Workers finish out of order, so a page can first be reached by a longer
+            # path; keep the shortest depth and re-expand its links if already crawled.
+            depth_map[u] = depth
+            if u in done:
+                for href in (state.get(u) or {}).get("outlinks", []):
+                    enqueue(href, depth + 1)
+
+    def checkpoint_now():
+        report.sync()
+        state.commit()
+        save_checkpoint(checkpoint_path, depth_map, pending, retries, sitemap_meta)
+        last_checkpoint[:] = [time.monotonic(), len(done)]
+
+    if checkpoint:
+        depth_map.update(checkpoint["depth_map"])
+        aliases.update((url_key(u), u) for u in depth_map)
+        retries.update(checkpoint.get("retries", {}))
+        sitemap_meta.update({u: tuple(v) for u, v in checkpoint.get("sitemap", {}).items()})
+        # Pages finished after the last checkpoint are already in the report: count them
+        # as done and replay their outlinks (in report order, so depths come out right).
+        for rec in report.records():
+            done.add(rec["url"]); kept.add(rec["url"]); live_hashes.add(rec["content_hash"])
+            delta[rec.get("change", "unchanged")].add(rec["url"])
+            dups.add(int(rec.get("simhash", "0"), 16), rec["url"], rec["content_hash"])
+        for rec in report.records():
+            depth = depth_map.setdefault(rec["url"], CRAWL_DEPTH)
+            for href in rec["outlinks"]:
+                if href in done:
+                    depth_map.setdefault(href, depth + 1)
+                else:
+                    enqueue(href, depth + 1)
+        for u in checkpoint["pending"]:
+            if u not in done and u not in pending:
+                push(u)
+        pbar.total += len(done); pbar.update(len(done))
+        print(f"Resuming crawl: {len(done)} pages done, {len(pending)} queued")
+    else:
+        # seed from sitemaps; their lastmod/priority order the frontier
+        sitemap_meta.update(await asyncio.to_thread(discover_from_sitemap, session, politeness))
+        enqueue(SITE_ROOT.rstrip("/"), 0)
+        for u in sitemap_meta:
+            enqueue(u, 0)
+    checkpoint_now()
+
+    def emit(rec, kind):
+        rec["change"] = kind
+        report.write(rec)
+        done.add(rec["url"]); live_hashes.add(rec["content_hash"])
+        delta[kind].add(rec["url"])
+
+    def settle(url, info, status, last_modified, kind):
+        # Common tail for fresh, 304 and reused pages: follow links, then emit the page
+        # under its canonical url unless that url or a near-identical text was already emitted.
+        kept.add(url)
+        for href in info["outlinks"]:
+            enqueue(href, depth_map[url] + 1)
+        owner = url
+        if info.get("canonical") and url_key(info["canonical"]) != url_key(url):
+            owner = aliases.setdefault(url_key(info["canonical"]), info["canonical"])
+            depth_map.setdefault(owner, depth_map[url])
+        if owner in done or dups.check_and_add(info["simhash"], owner, info["content_hash"]) not in (None, owner):
+            delta["duplicate"].add(url)
+            return
+        emit(page_record(owner, status, info["title"], last_modified, info["content_hash"],
+                         info["outlinks"], info["simhash"]), kind)
+
+    def carry_over(prev):
+        # Transient failure: keep serving the last good copy instead of dropping the page.
+        if prev and prev["content_hash"]:
+            settle(prev["url"], prev, prev["status"], prev["last_modified"], "unchanged")
+
+    async def fetch(url, prev):
+        throttle = await asyncio.to_thread(politeness.admit, url)
+        if throttle is None:
+            return
+        # only revalidate when the cached body is still there; a 304 would leave curate nothing to read
+        cached = prev if prev and cache.has(prev["content_hash"]) else None
+        lastmod = sitemap_meta.get(url, (None, None))[0]
+        if cached and lastmod and cached["fetched_at"] >= lastmod:
+            # sitemap says nothing changed since our copy: no request at all
+            settle(url, cached, cached["status"], cached["last_modified"], "unchanged")
+            return
+        r = await polite_get(session, throttle, url, state.conditional_headers(cached))
+        if r.status_code in BACKOFF_STATUSES and retries.get(url, 0) < MAX_RETRIES:
+            # the host throttle now holds off until Retry-After; just requeue
+            retries[url] = retries.get(url, 0) + 1
+            push(url)
+            return
+        if r.status_code == 304 and cached:
+            state.touch(url)
+            settle(url, cached, cached["status"], r.headers.get("Last-Modified", cached["last_modified"]), "unchanged")
+            return
+        if r.status_code >= 500 or r.status_code in BACKOFF_STATUSES:  # 5xx, or 429 past MAX_RETRIES
+            carry_over(prev)
+            return
+        if r.status_code != 200 or "text/html" not in r.headers.get("Content-Type",""):
+            return
+        html = r.text
+        # a redirect off-site (apex -> www) must not become the page's url or the base
+        # its relative links resolve against: both would fall out of ALLOW_DOMAINS
+        base = r.url if is_in_scope(r.url) else url
+        info = await loop.run_in_executor(process_pool(), parse_page, base, html)
+        await asyncio.to_thread(cache.put, info["content_hash"], html)
+        state.put(url, r.headers.get("ETag"), r.headers.get("Last-Modified"), info["content_hash"], r.status_code,
+                  info["title"], info["outlinks"], info["canonical"], info["simhash"])
+        kind = "added" if not prev else ("unchanged" if prev["content_hash"] == info["content_hash"] else "changed")
+        settle(url, info, r.status_code, r.headers.get("Last-Modified"), kind)
+
+    async def worker():
+        while True:
+            _, _, url = await queue.get()
+            prev = state.get(url)
+            requeues = retries.get(url, 0)
+            try:
+                if url not in done:  # already emitted through an alias pointing here
+                    await fetch(url, prev)
+            except asyncio.CancelledError:
+                raise  # interrupted mid-fetch: url stays pending for --resume
+            except Exception:
+                carry_over(prev)
+            if retries.get(url, 0) == requeues:
+                pending.discard(url)
+            pbar.update(1)
+            progress("crawl", pbar.n, pbar.total)
+            queue.task_done()
+            if (len(done) - last_checkpoint[1] >= CHECKPOINT_EVERY
+                    or time.monotonic() - last_checkpoint[0] >= CHECKPOINT_SECS):
+                checkpoint_now()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, CRAWL_CONCURRENCY))]
+    try:
+        await queue.join()
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        session.close()
+        pbar.close()
+        if pending:  # interrupted: leave report.partial + checkpoint for --resume
+            checkpoint_now()
+            report.close()
+            state.close()
+    progress("crawl", pbar.n, pbar.total, force=True)
+    delta["removed"] = set(state.urls()) - kept
+    state.remove(delta["removed"])
+    state.close()
+    cache.evict(keep=live_hashes)
+    report.publish()
+    write_delta(os.path.join(OUTPUT_DIR, "crawl_delta.json"), delta)
+    os.remove(checkpoint_path)
+    return len(done), delta
+
+def crawl(resume=False):
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    session = requests.Session()
-    queue = [SITE_ROOT.rstrip("/")]
-    seen = set(queue)
-    # seed from sitemap
-    for u in discover_from_sitemap(session):
-        if u not in seen:
-            queue.append(u); seen.add(u)
-    depth_map = {u:0 for u in queue}
-    pages = []
-    pbar = tqdm(total=len(queue), desc="Crawling")
-    while queue:
-        url = queue.pop(0)
-        pbar.update(1)
-        if not allowed_by_robots(url):
-            continue
-        try:
-            r = polite_get(session, url)
-            if r.status_code != 200 or "text/html" not in r.headers.get("Content-Type",""):
-                continue
-            soup = BeautifulSoup(r.text, "lxml")
-            title = extract_title(soup)
-            main = soup.body or soup
-            text = clean_html(str(main))
-            chash = hash_text(text)
-            outlinks = []
-            for a in soup.find_all("a", href=True):
-                href = urljoin(url, a["href"].split("#")[0])
-                if is_in_scope(href):
-                    outlinks.append(href)
-                    if href not in seen and depth_map[url] + 1 <= CRAWL_DEPTH:
-                        queue.append(href); seen.add(href); depth_map[href]=depth_map[url]+1; pbar.total+=1
-            pages.append({
-                "url": url,
-                "status": r.status_code,
-                "title": title,
-                "last_modified": r.headers.get("Last-Modified"),
-                "discovered_at": now_iso(),
-                "content_hash": chash,
-                "outlinks": sorted(set(outlinks))
-            })
-        except Exception:
-            continue
-    pbar.close()
-    with open(os.path.join(OUTPUT_DIR, "crawl_report.json"), "w", encoding="utf-8") as f:
-        json.dump(pages, f, ensure_ascii=False, indent=2)
-    print("Crawl finished. pages:", len(pages))
+    process_pool(warm=True)  # fork the extractors before the event loop starts any threads
+    try:
+        n, delta = asyncio.run(_crawl_async(resume))
+    finally:
+        shutdown_pool()
+    print("Crawl finished. pages:", n, {k: len(v) for k, v in delta.items()})
 
 if __name__ == "__main__":
-    crawl()
-
+    try:
+        crawl(resume="--resume" in sys.argv[1:])
+    except KeyboardInterrupt:
+        print("Crawl interrupted; progress saved. Continue with: python crawler.py --resume")
+        sys.exit(130)
@@ -1,97 +1,504 @@
 # curate.py
-import os, json, hashlib, orjson, time
-from bs4 import BeautifulSoup
+import os, sys, json, hashlib, orjson, time, queue, threading, sqlite3, shutil
 import requests
-from markdownify import markdownify as md
+import numpy as np
 import nltk
-from sentence_transformers import SentenceTransformer
 import faiss
 from tqdm import tqdm
+from page_cache import PageCache
+from crawl_state import iter_report, write_json_atomic
+from emb_cache import EmbeddingCache
+from chunker import chunk_text
+from docstore import DocStore, DOCSTORE_FILE, migrate_json
+import ann
+import kb_versions
+import keywords
+import lexical
+import embedder
+import kb_filters
+from extract import extract_text, process_pool, shutdown_pool, EXTRACT_WORKERS
+from dedup import simhash, SimHashIndex
+from refresh_jobs import progress
 
 nltk.download("punkt", quiet=True)
 SITE_ROOT = os.environ.get("SITE_ROOT", "https://harrissces.com/")
 KB_DIR = os.environ.get("KB_DIR", "kb")
 EMB_MODEL = os.environ.get("EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "900"))
-OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "120"))
+OFFLINE = os.environ.get("KB_OFFLINE", "0") == "1"
+EMB_BATCH_SIZE = int(os.environ.get("EMB_BATCH_SIZE", "64"))
+EMB_PROCESSES = int(os.environ.get("EMB_PROCESSES", "1"))
+FETCH_WORKERS = int(os.environ.get("CURATE_FETCH_WORKERS", "8"))
+PIPELINE_QUEUE = int(os.environ.get("PIPELINE_QUEUE", str(max(16, 4 * EXTRACT_WORKERS))))
+CURATE_MAX_FAILED = float(os.environ.get("CURATE_MAX_FAILED", "0.05"))  # share of pages
+CHUNK_SIMHASH_MAX_DISTANCE = int(os.environ.get("CHUNK_SIMHASH_MAX_DISTANCE", "3"))  # -1: exact repeats only
+BOILERPLATE_MIN_PAGES = int(os.environ.get("BOILERPLATE_MIN_PAGES", "5"))
+INDEX_META = "index_meta.json"
+EMB_KEY = embedder.cache_key(EMB_MODEL)  # embedding-cache key: model + EMB_BACKEND
+_DONE = object()
 
 def now_iso(): return time.strftime("%Y-%m-%d")
 
-def fetch_text(url):
-    r = requests.get(url, timeout=20, headers={"User-Agent":"harriss-autobot/1.0"})
+def fetch_html(p, cache, offline=OFFLINE):
+    # The crawler already stored this page's HTML under its content_hash; only go to
+    # the network when the cache misses (never when offline).
+    html = cache.get(p.get("content_hash"))
+    if html is not None:
+        return html
+    if offline:
+        raise LookupError(f"not in page cache: {p['url']}")
+    r = requests.get(p["url"], timeout=20, headers={"User-Agent":"harriss-autobot/1.0"})
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, "lxml")
-    main = soup.body or soup
-    return md(str(main), strip=["script","style"])
-
-def chunk_text(text):
-    from nltk import sent_tokenize
-    sents = sent_tokenize(text)
-    chunks = []
-    buff = ""
-    for s in sents:
-        if len(buff) + len(s) < CHUNK_SIZE:
-            buff += (" " + s)
-        else:
-            chunks.append(buff.strip())
-            buff = s
-    if buff.strip():
-        chunks.append(buff.strip())
-    # add small overlap
+    return r.text
+
+def prepare_page(p, html):
+    # Extraction-pool job: HTML -> [(chunk, checksum, tags, simhash)], plus worker seconds spent.
+    t0 = time.perf_counter()
     out = []
-    for i,c in enumerate(chunks):
-        prev = chunks[i-1][-OVERLAP:] if i>0 else ""
-        out.append((prev + "\n" + c).strip())
-    return out
+    for ch in chunk_text(extract_text(html)):
+        out.append((ch, hashlib.sha256(ch.encode("utf-8")).hexdigest(), tag_chunk(ch), simhash(ch)))
+    return out, time.perf_counter() - t0
 
 def tag_chunk(text):
-    tl = text.lower()
-    tags=[]
-    if any(k in tl for k in ["service","offer","solution","we provide"]): tags.append("services")
-    if any(k in tl for k in ["price","pricing","cost","quote"]): tags.append("pricing")
-    if any(k in tl for k in ["contact","address","phone","email","location"]): tags.append("contact")
-    if any(k in tl for k in ["faq","frequently asked"]): tags.append("faq")
-    if not tags: tags.append("general")
-    return tags
-
-def build_kb():
+    # whole-word tag vocabulary from keywords.py: a str.find scan per keyword, with word
+    # boundaries checked only where a keyword occurs
+    return keywords.tag_matcher().labels(text) or ["general"]
+
+def embed_texts(emb, texts, batch_size=EMB_BATCH_SIZE, processes=EMB_PROCESSES, progress=True, pool=None):
+    # Encode longest-first so each batch pads to similar lengths, writing straight into
+    # one preallocated float32 matrix in the original order. processes > 1 spreads the
+    # batches over a SentenceTransformer multi-process CPU pool (the caller's, if given).
+    # emb: an embedder.Embedder (EMB_BACKEND).
+    model = emb.model
+    X = np.empty((len(texts), emb.dim), dtype="float32")
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    own_pool = pool is None and processes > 1
+    if own_pool:
+        pool = model.start_multi_process_pool(["cpu"] * processes)
+    step = batch_size * processes * 8 if pool else batch_size
+    try:
+        for start in tqdm(range(0, len(order), step), desc="Embedding", unit="batch", disable=not progress):
+            ids = order[start:start + step]
+            batch = [texts[i] for i in ids]
+            if pool:
+                E = model.encode_multi_process(batch, pool, batch_size=batch_size)
+                E /= np.clip(np.linalg.norm(E, axis=1, keepdims=True), 1e-12, None)
+            else:
+                E = emb.encode(batch, batch_size=batch_size)
+            X[ids] = E
+    finally:
+        if own_pool:
+            model.stop_multi_process_pool(pool)
+    return X
+
+def report_path(kb_dir=KB_DIR):
+    # crawler.py streams crawl_report.jsonl; older runs left a single crawl_report.json
+    for name in ("crawl_report.jsonl", "crawl_report.json"):
+        path = os.path.join(kb_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+def load_previous(kb_dir, emb_model=EMB_MODEL):
+    # (index, its ann parameters, {id: (url, checksum)}) of the live build in kb_dir. The
+    # ids come from the docstore and survive any rebuild; the index is only returned when
+    # it was built by the same model and backend, carries those ids and agrees with the docstore.
+    keys = {}
+    if kb_dir is None:
+        return None, None, keys
+    try:
+        path, legacy = os.path.join(kb_dir, DOCSTORE_FILE), os.path.join(kb_dir, "docstore.json")
+        if not os.path.exists(path) and os.path.exists(legacy):
+            migrate_json(legacy, path)
+        if os.path.exists(path):
+            store = DocStore(path)
+            keys = store.keys()
+            store.close()
+        with open(os.path.join(kb_dir, INDEX_META), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model") != emb_model or meta.get("backend", "torch") != embedder.backend_id():
+            return None, None, keys  # other model or EMB_BACKEND: every vector is re-read from the cache
+        index = faiss.read_index(os.path.join(kb_dir, "embeddings.index"))
+    except (OSError, ValueError, RuntimeError, sqlite3.Error):
+        return None, None, keys
+    params = meta.get("index") or {"type": "flat", "metric": "ip"}  # builds before ann.py: IDMap2 + flat
+    if params["type"] == "flat" and not isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return None, None, keys
+    if index.ntotal != len(keys):
+        return None, None, keys
+    return index, params, keys
+
+def previous_chunks(kb_dir, urls):
+    # {url: [(chunk, checksum, tags, simhash)]} of these pages in the build in kb_dir, in
+    # id (= first seen) order: what a page that failed to fetch or extract is kept as.
+    out, want = {}, set(urls)
+    path = os.path.join(kb_dir, DOCSTORE_FILE) if kb_dir else None
+    if not want or path is None or not os.path.exists(path):
+        return out
+    store = DocStore(path)
+    try:
+        ids = [i for i, (_, us) in store.sources().items() if want.intersection(us)]
+        for _, doc in sorted(store.get_many(ids).items()):
+            for url in want.intersection(doc["urls"]):
+                out.setdefault(url, []).append((doc["content"], doc["checksum"], doc["tags"], simhash(doc["content"])))
+    finally:
+        store.close()
+    return out
+
+def dedup_chunks(pages, old_owners=(), max_distance=CHUNK_SIMHASH_MAX_DISTANCE, min_pages=BOILERPLATE_MIN_PAGES):
+    # One doc per unique chunk. Exact repeats (same checksum) fold into the first
+    # occurrence, which lists every page it appears on. Near duplicates (chunk SimHash
+    # within max_distance bits) fold only into a chunk repeated word for word on
+    # min_pages or more pages - site-wide headers, footers, cookie and CTA blocks: a few
+    # bits is also what a changed price, phone number or city costs, and such a chunk
+    # must keep its own text. Chunks that owned a group in the previous build claim
+    # theirs first, so groups (and their ids) stay put. Returns ([doc], number folded).
+    flat = [(p, ch) for p, chunks in pages for ch in chunks]
+    spread = {}
+    for p, (_, checksum, _, _) in flat:
+        spread.setdefault(checksum, set()).add(p["url"])
+    common = {c for c, urls in spread.items() if len(urls) >= min_pages}
+    sims, owner_of = SimHashIndex(max(0, max_distance)), {}
+    for _, (_, checksum, _, shash) in sorted(flat, key=lambda x: (x[1][1] not in common, x[1][1] not in old_owners)):
+        if checksum not in owner_of:
+            owner = sims.find(shash if max_distance >= 0 else 0, exact_key=checksum)
+            if owner is None:  # only site-wide chunks take near duplicates in
+                sims.add(shash if max_distance >= 0 and checksum in common else 0, checksum, exact_key=checksum)
+            owner_of[checksum] = owner or checksum
+    groups = {}
+    for p, (text, checksum, tags, _) in flat:  # report order: first url is where the owner appears first
+        g = groups.setdefault(owner_of[checksum], {"checksum": owner_of[checksum], "urls": []})
+        if checksum == g["checksum"] and "content" not in g:
+            g.update(content=text, url=p["url"], title=p.get("title", ""), tags=tags, last_seen=now_iso())
+        if p["url"] not in g["urls"]:
+            g["urls"].append(p["url"])
+    return list(groups.values()), len(flat) - len(groups)
+
+def assign_ids(chunks, old_keys):
+    # Chunk ids are stable across builds: a checksum that was indexed before keeps its
+    # id, new chunks get ids above the old maximum. (Builds from before chunk dedup had
+    # one id per page copy; the extra copies are dropped.)
+    old = {}
+    for i, (_, checksum) in sorted(old_keys.items()):
+        old.setdefault(checksum, i)
+    next_id = max(old_keys, default=-1) + 1
+    docs = {}
+    for doc in chunks:
+        i = old.get(doc["checksum"])
+        if i is None:
+            i, next_id = next_id, next_id + 1
+        docs[i] = doc
+    return docs
+
+def write_docstore(docs, added, removed, prev_dir, out_dir):
+    # The new version's docstore: the previous one copied and patched with the id delta
+    # (published versions are never modified), or written from scratch. Kept chunks
+    # whose pages (appeared on a new page, lost one), title or tags (keywords.json
+    # edited) changed are rewritten too.
+    path = os.path.join(out_dir, DOCSTORE_FILE)
+    prev = os.path.join(prev_dir, DOCSTORE_FILE) if prev_dir else None
+    incremental = prev is not None and os.path.exists(prev)
+    if incremental:
+        shutil.copyfile(prev, path)
+    store = DocStore(path, readonly=False)
+    if incremental:
+        fresh = set(added)
+        stale = [i for i, row in store.meta().items() if i in docs and i not in fresh and row !=
+                 (docs[i]["url"], docs[i].get("title") or "", docs[i].get("tags") or [], docs[i]["urls"])]
+        store.apply(docs, added + stale, removed, last_seen=now_iso())
+    else:
+        store.apply(docs, list(docs), [], last_seen=now_iso())
+    store.close()
+    return path
+
+class StageStats:
+    def __init__(self, name, unit):
+        self.name, self.unit = name, unit
+        self.items, self.busy = 0, 0.0
+        self.lock = threading.Lock()
+
+    def add(self, items, secs):
+        with self.lock:
+            self.items += items
+            self.busy += secs
+
+    def line(self, wall):
+        rate = self.items / self.busy if self.busy else 0.0
+        return (f"  {self.name:<8} {self.items:6d} {self.unit:<6} busy {self.busy:7.2f}s "
+                f"({rate:8.1f} {self.unit}/s busy, {self.items / max(wall, 1e-9):8.1f}/s wall)")
+
+def run_pipeline(pages, offline=OFFLINE, total=None):
+    # fetch (I/O threads) -> extract + chunk (process pool) -> embed (batching thread),
+    # all running at once. Every hand-off is bounded, so a slow stage holds back the
+    # ones before it instead of letting pages pile up in memory. Only chunks missing
+    # from the embedding cache reach the embed stage; their vectors go straight into it.
+    # Returns [(page, [(chunk, checksum, tags, simhash)])] in report order, [(page, reason)]
+    # for pages that failed to fetch or extract, and per-stage stats.
+    pool = process_pool(warm=True)  # fork the extraction workers before any thread starts
+    stats = {"fetch": StageStats("fetch", "pages"), "extract": StageStats("extract", "pages"),
+             "embed": StageStats("embed", "chunks")}
+    html_q = queue.Queue(PIPELINE_QUEUE)
+    chunk_q = queue.Queue()  # bounded by `slots`: released only when the consumer takes an item
+    embed_q = queue.Queue(PIPELINE_QUEUE)
+    slots = threading.Semaphore(PIPELINE_QUEUE)
+    source, source_lock = enumerate(pages), threading.Lock()
+    errors, failed, queued, done = [], [], set(), [0]
+    stop = threading.Event()  # set when the consumer fails or is interrupted (Ctrl-C, cancel)
+
+    def put(q, item):
+        # Blocking put that gives up once the pipeline is stopping: nobody drains the
+        # queues then, and a producer stuck in put() would hang the join below.
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def acquire():
+        while not slots.acquire(timeout=0.1):
+            if stop.is_set():
+                return False
+        return True
+
+    def report(force=False):  # refresh job progress: pages through extract, chunks embedded
+        progress("curate", done[0], total, force=force,
+                 embedded=stats["embed"].items, to_embed=len(queued))
+
+    def fetcher():
+        cache = PageCache()
+        while not stop.is_set():
+            with source_lock:
+                item = next(source, None)
+            if item is None:
+                break
+            seq, p = item
+            t0 = time.perf_counter()
+            try:
+                html = fetch_html(p, cache, offline)
+            except Exception as e:
+                html = None
+                failed.append((seq, p, f"fetch: {e!r}"))
+            stats["fetch"].add(1, time.perf_counter() - t0)
+            if html is not None:
+                put(html_q, (seq, p, html))
+        put(html_q, _DONE)
+
+    def dispatcher():
+        finished = 0
+        while finished < FETCH_WORKERS:
+            item = get(html_q)
+            if item is _DONE:
+                finished += 1
+                continue
+            seq, p, html = item
+            if not acquire():
+                return
+            try:
+                fut = pool.submit(prepare_page, p, html)
+            except Exception:
+                chunk_q.put((seq, p, None))
+                continue
+            fut.add_done_callback(lambda f, seq=seq, p=p: chunk_q.put((seq, p, f)))
+        for _ in range(PIPELINE_QUEUE):  # every submitted page has been consumed
+            if not acquire():
+                return
+        chunk_q.put(_DONE)
+
+    def embed_stage():
+        emb, cache, mp_pool, batch = None, None, None, {}
+        def flush():
+            nonlocal emb, cache, mp_pool
+            if not batch or errors:
+                batch.clear()
+                return
+            t0 = time.perf_counter()
+            try:
+                if emb is None:
+                    emb = embedder.load(EMB_MODEL)
+                    if EMB_PROCESSES > 1:
+                        mp_pool = emb.model.start_multi_process_pool(["cpu"] * EMB_PROCESSES)
+                cache = cache or EmbeddingCache()
+                E = embed_texts(emb, list(batch.values()), progress=False, pool=mp_pool)
+                cache.put_many(EMB_KEY, list(batch), E)
+            except Exception as e:
+                errors.append(e)  # keep draining so upstream stages never block on us
+            stats["embed"].add(len(batch), time.perf_counter() - t0)
+            batch.clear()
+            report()
+        while True:
+            item = get(embed_q)
+            if item is _DONE:
+                break
+            batch[item[0]] = item[1]
+            if len(batch) >= EMB_BATCH_SIZE * max(1, EMB_PROCESSES) * 4:
+                flush()
+        if not stop.is_set():
+            flush()
+        if mp_pool:
+            emb.model.stop_multi_process_pool(mp_pool)
+        if cache:
+            cache.close()
+
+    threads = [threading.Thread(target=fetcher, daemon=True) for _ in range(FETCH_WORKERS)]
+    threads += [threading.Thread(target=dispatcher, daemon=True), threading.Thread(target=embed_stage, daemon=True)]
+    t_start = time.perf_counter()
+    for t in threads:
+        t.start()
+    results = []
+    cache = EmbeddingCache()
+    try:
+        with tqdm(desc="Curating pages", unit="page", total=total) as pbar:
+            while True:
+                item = chunk_q.get()
+                if item is _DONE:
+                    break
+                slots.release()
+                seq, p, fut = item
+                pbar.update(1)
+                done[0] += 1
+                report()
+                try:
+                    if fut is None:
+                        raise RuntimeError("extraction pool unavailable")
+                    chunks, secs = fut.result()
+                except Exception as e:
+                    failed.append((seq, p, f"extract: {e!r}"))
+                    continue
+                stats["extract"].add(1, secs)
+                results.append((seq, p, chunks))
+                fresh = [c for _, c, _, _ in chunks if c not in queued]
+                known = cache.get_many(EMB_KEY, fresh)
+                for ch, checksum, _, _ in chunks:
+                    if checksum not in known and checksum not in queued:
+                        queued.add(checksum)
+                        embed_q.put((checksum, ch))
+                pbar.set_postfix(fetched=html_q.qsize(), embed=embed_q.qsize())
+        put(embed_q, _DONE)
+    except BaseException:
+        stop.set()  # every stage stops waiting on the others and returns
+        raise
+    finally:
+        cache.close()
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+    report(force=True)
+    wall = time.perf_counter() - t_start
+    print(f"Pipeline: {wall:.2f}s wall")
+    for st in stats.values():
+        print(st.line(wall))
+    results.sort(key=lambda r: r[0])
+    failed.sort(key=lambda r: r[0])
+    return [(p, chunks) for _, p, chunks in results], [(p, why) for _, p, why in failed], stats
+
+def keep_failed(pages, failed, prev_dir):
+    # Pages that failed this time keep their chunks from the live build (when all their
+    # vectors are still cached), so one bad fetch or a dead extraction worker doesn't
+    # take them out of the KB. More than CURATE_MAX_FAILED of all pages failing stops
+    # the build before anything is published.
+    total = len(pages) + len(failed)
+    print(f"{len(failed)} of {total} pages failed to fetch or extract:")
+    for p, why in failed[:20]:
+        print(f"  {p['url']}: {why}")
+    if len(failed) > 20:
+        print(f"  ... and {len(failed) - 20} more")
+    if len(failed) > CURATE_MAX_FAILED * total:
+        raise RuntimeError(f"{len(failed)} of {total} pages failed (over CURATE_MAX_FAILED={CURATE_MAX_FAILED}); "
+                           "nothing was published.")
+    old = previous_chunks(prev_dir, [p["url"] for p, _ in failed])
+    cache = EmbeddingCache()
+    try:
+        cached = cache.get_many(EMB_KEY, [c for chunks in old.values() for _, c, _, _ in chunks])
+    finally:
+        cache.close()
+    kept = [(p, old[p["url"]]) for p, _ in failed
+            if old.get(p["url"]) and all(c in cached for _, c, _, _ in old[p["url"]])]
+    print(f"Keeping the previous chunks of {len(kept)} of them ({len(failed) - len(kept)} had none to keep)")
+    return pages + kept
+
+def build_kb(offline=OFFLINE):
     os.makedirs(KB_DIR, exist_ok=True)
-    crawl_file = os.path.join(KB_DIR, "crawl_report.json")
-    assert os.path.exists(crawl_file), "Run crawler.py first."
-    with open(crawl_file, "r", encoding="utf-8") as f:
-        pages = json.load(f)
-    model = SentenceTransformer(EMB_MODEL)
-    docs = []
-    meta_map = {}
-    idx = 0
-    for p in tqdm(pages, desc="Curating pages"):
-        try:
-            text = fetch_text(p["url"])
-            title = p.get("title","")
-            chunks = chunk_text(text)
-            for ch in chunks:
-                checksum = hashlib.sha256(ch.encode("utf-8")).hexdigest()
-                md = {"url": p["url"], "title": title, "last_seen": now_iso(), "checksum": checksum, "tags": tag_chunk(ch)}
-                meta_map[str(idx)] = md
-                emb = model.encode(ch, normalize_embeddings=True)
-                docs.append((emb, ch))
-                idx += 1
-        except Exception:
-            continue
-    if not docs:
+    crawl_file = report_path()
+    assert crawl_file, "Run crawler.py first."
+    total = None
+    if crawl_file.endswith(".jsonl"):  # one page per line: the ETA for the refresh job
+        with open(crawl_file, "rb") as f:
+            total = sum(1 for line in f if line.strip())
+    pages, failed, stats = run_pipeline(iter_report(crawl_file), offline, total)
+    prev_dir = kb_versions.active_dir(KB_DIR)
+    if failed:
+        pages = keep_failed(pages, failed, prev_dir)
+    index, params, old_keys = load_previous(prev_dir)
+    chunks, folded = dedup_chunks(pages, {c for _, c in old_keys.values()})
+    if not chunks:
         raise RuntimeError("No docs to index. Check crawl output.")
-    import numpy as np
-    X = np.vstack([d[0] for d in docs]).astype("float32")
-    dim = X.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(X)
-    faiss.write_index(index, os.path.join(KB_DIR, "embeddings.index"))
-    # Save text docstore separately
-    doc_texts = {str(i): {"content": docs[i][1], **meta_map[str(i)]} for i in range(len(docs))}
-    with open(os.path.join(KB_DIR, "docstore.json"), "w", encoding="utf-8") as f:
-        json.dump(doc_texts, f, ensure_ascii=False, indent=2)
-    print("KB built:", os.path.join(KB_DIR, "embeddings.index"), os.path.join(KB_DIR, "docstore.json"))
+    print(f"Chunks: {len(chunks) + folded} from {len(pages)} pages, {len(chunks)} unique "
+          f"({folded} repeated / near-duplicate copies folded)")
+    docs = assign_ids(chunks, old_keys)
+    added = [i for i in docs if i not in old_keys]
+    removed = [i for i in old_keys if i not in docs]
+    # The pipeline has put every chunk's vector in the embedding cache by now. The old
+    # index takes the id delta when it can; otherwise (new INDEX_TYPE / VECTOR_STORAGE, model, HNSW
+    # deletions, IVF outgrowing its training) it is rebuilt from cached vectors.
+    cache = EmbeddingCache()
+    try:
+        checksums = [docs[i]["checksum"] for i in added]
+        vecs = cache.get_many(EMB_KEY, checksums)
+        any_sum = docs[next(iter(docs))]["checksum"]
+        dim = index.d if index is not None else len(cache.get_many(EMB_KEY, [any_sum])[any_sum])
+        want = ann.index_params(len(docs), dim)
+        if index is not None and ann.same_layout(params, want) and ann.can_update(index, params, removed, len(docs)):
+            if removed:
+                index.remove_ids(np.array(removed, dtype="int64"))
+            if added:
+                X = np.vstack([vecs[c] for c in checksums]).astype("float32")
+                index.add_with_ids(X, np.array(added, dtype="int64"))
+            rebuilt = False
+        else:
+            ids = list(docs)
+            vecs = cache.get_many(EMB_KEY, [docs[i]["checksum"] for i in ids])
+            X = np.vstack([vecs[docs[i]["checksum"]] for i in ids])
+            t0 = time.perf_counter()
+            index = ann.build_index(X, ids, want)
+            params, rebuilt = {**want, "trained_on": len(ids)}, True
+            print(f"Index: {ann.factory_string(params)} built over {len(ids)} vectors in {time.perf_counter() - t0:.2f}s")
+        # keep folded copies' vectors too, or the pipeline would re-encode them next build
+        cache.prune(EMB_KEY, (c for _, chunks in pages for _, c, _, _ in chunks))
+    finally:
+        cache.close()
+    # Everything goes into a new version directory; readers switch when CURRENT moves.
+    version, out_dir = kb_versions.new_version(KB_DIR)
+    try:
+        write_docstore(docs, added, removed, prev_dir if old_keys else None, out_dir)
+        faiss.write_index(index, os.path.join(out_dir, "embeddings.index"))
+        t0 = time.perf_counter()
+        postings = lexical.build({i: d["content"] for i, d in docs.items()}, os.path.join(out_dir, lexical.LEXICAL_DIR))
+        print(f"BM25: {postings} postings over {len(docs)} chunks in {time.perf_counter() - t0:.2f}s")
+        keys, _ = kb_filters.build({i: (d.get("tags") or [], d.get("urls") or [d["url"]]) for i, d in docs.items()}, out_dir)
+        print(f"Filters: {len(keys['tags'])} tags, {len(keys['prefixes'])} URL prefixes")
+        write_json_atomic(os.path.join(out_dir, INDEX_META),
+                          {"model": EMB_MODEL, "backend": embedder.backend_id(), "dim": dim, "count": index.ntotal, "built": now_iso(),
+                           "version": version, "index": params})
+    except BaseException:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        raise
+    path = kb_versions.publish(version, KB_DIR)
+    print(f"KB built: {path} ({index.ntotal} chunks: +{len(added)} -{len(removed)}, "
+          f"{stats['embed'].items} newly embedded{', index rebuilt' if rebuilt else ''})")
 
 if __name__ == "__main__":
-    build_kb()
+    try:
+        build_kb(offline=OFFLINE or "--offline" in sys.argv[1:])
+    finally:
+        shutdown_pool()
 
@@ -0,0 +1,64 @@
+# dedup.py
+import os, re, hashlib
+import numpy as np
+
+SIMHASH_SHINGLE = int(os.environ.get("SIMHASH_SHINGLE", "3"))
+SIMHASH_MAX_DISTANCE = int(os.environ.get("SIMHASH_MAX_DISTANCE", "3"))
+_WORD = re.compile(r"\w+", re.U)
+_BITS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+
+def simhash(text, shingle=SIMHASH_SHINGLE):
+    # 64-bit SimHash over word shingles; near-identical texts land a few bits apart.
+    words = _WORD.findall(text.lower())
+    if not words:
+        return 0
+    n = max(1, len(words) - shingle + 1)
+    grams = {" ".join(words[i:i + shingle]) for i in range(n)}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little") for g in grams),
+        dtype=np.uint64, count=len(grams))
+    votes = ((hashes[:, None] & _BITS) != 0).sum(axis=0) * 2 - len(hashes)
+    return int(((votes > 0).astype(np.uint64) * _BITS).sum())
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class SimHashIndex:
+    # Finds a stored fingerprint within max_distance bits. The 64 bits are split into
+    # max_distance + 1 bands; by pigeonhole a near duplicate matches one band exactly,
+    # so a lookup only compares against fingerprints sharing a band.
+    def __init__(self, max_distance=SIMHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width = 64 // bands
+        self._bands = [(i * width, 64 if i == bands - 1 else (i + 1) * width) for i in range(bands)]
+        self._tables = [dict() for _ in self._bands]
+        self._exact = {}
+
+    def _keys(self, h):
+        return [(h >> lo) & ((1 << (hi - lo)) - 1) for lo, hi in self._bands]
+
+    def find(self, h, exact_key=None):
+        if exact_key is not None and exact_key in self._exact:
+            return self._exact[exact_key]
+        if not h:
+            return None
+        for table, key in zip(self._tables, self._keys(h)):
+            for other, owner in table.get(key, ()):
+                if hamming(h, other) <= self.max_distance:
+                    return owner
+        return None
+
+    def add(self, h, owner, exact_key=None):
+        if exact_key is not None:
+            self._exact.setdefault(exact_key, owner)
+        if h:
+            for table, key in zip(self._tables, self._keys(h)):
+                table.setdefault(key, []).append((h, owner))
+
+    def check_and_add(self, h, owner, exact_key=None):
+        # Owner of an existing (near) duplicate, or None after registering this one.
+        found = self.find(h, exact_key)
+        if found is None:
+            self.add(h, owner, exact_key)
+        return found
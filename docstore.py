@@ -0,0 +1,140 @@
+# docstore.py
+import os, json, sqlite3
+from collections.abc import Mapping
+
+DOCSTORE_FILE = "docstore.sqlite"
+DOCSTORE_MMAP_MB = int(os.environ.get("DOCSTORE_MMAP_MB", "256"))
+FIELDS = ("url", "title", "last_seen", "checksum", "tags", "content", "urls")
+JSON_FIELDS = ("tags", "urls")
+_POS = {f: i for i, f in enumerate(FIELDS)}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    url TEXT,
+    title TEXT,
+    last_seen TEXT,
+    checksum TEXT,
+    tags TEXT,
+    content TEXT,
+    urls TEXT
+)
+"""
+
+class Doc(Mapping):
+    # Read-only view of one docstore row, plus the search score when it came from a
+    # search. Nothing is copied or decoded until a field is asked for.
+    __slots__ = ("id", "_row", "_score")
+
+    def __init__(self, id, row, score=None):
+        self.id, self._row, self._score = id, row, score
+
+    def __getitem__(self, key):
+        if key == "score" and self._score is not None:
+            return self._score
+        value = self._row[_POS[key]]
+        if key == "urls":  # every page the chunk appears on; just `url` in older docstores
+            return json.loads(value or "[]") or [self._row[_POS["url"]]]
+        return json.loads(value or "[]") if key == "tags" else value
+
+    def __iter__(self):
+        yield from FIELDS
+        if self._score is not None:
+            yield "score"
+
+    def __len__(self):
+        return len(FIELDS) + (self._score is not None)
+
+    def scored(self, score):
+        return Doc(self.id, self._row, score)
+
+    def __repr__(self):
+        return f"Doc({self.id}, {self['url']!r})"
+
+class DocStore:
+    # Chunk texts + metadata keyed by the integer FAISS id, in one SQLite file. Readers
+    # open it read-only and memory-mapped, so the OS page cache is shared by every
+    # process serving the KB and only the rows of actual hits are ever read.
+    def __init__(self, path, readonly=True):
+        self.path = path
+        if not os.path.exists(path) or not readonly:
+            db = sqlite3.connect(path)
+            db.execute(SCHEMA)
+            if "urls" not in {r[1] for r in db.execute("PRAGMA table_info(docs)")}:
+                db.execute("ALTER TABLE docs ADD COLUMN urls TEXT")  # docstores from before chunk dedup
+            db.commit()
+            if readonly:
+                db.close()
+            else:
+                self.db = db
+        if readonly:
+            self.db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            self.db.execute("PRAGMA query_only=1")
+        self.db.execute(f"PRAGMA mmap_size={DOCSTORE_MMAP_MB * 1024 * 1024}")
+        self._have = {r[1] for r in self.db.execute("PRAGMA table_info(docs)")}
+        self._cols = ", ".join(self._col(f) for f in FIELDS)
+
+    def _col(self, f):
+        return f if f in self._have else f"NULL AS {f}"
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def get(self, id):
+        row = self.db.execute(f"SELECT {self._cols} FROM docs WHERE id=?", (int(id),)).fetchone()
+        return Doc(int(id), row) if row else None
+
+    def get_many(self, ids):
+        ids = [int(i) for i in ids]
+        out = {}
+        for n in range(0, len(ids), 900):  # under SQLite's bound-parameter limit
+            part = ids[n:n + 900]
+            rows = self.db.execute(
+                f"SELECT id, {self._cols} FROM docs WHERE id IN ({', '.join('?' * len(part))})", part)
+            out.update((r[0], Doc(r[0], r[1:])) for r in rows)
+        return out
+
+    def keys(self):
+        # id -> (url, checksum) for every chunk, without touching the content column's pages
+        return {i: (u, c) for i, u, c in self.db.execute("SELECT id, url, checksum FROM docs")}
+
+    def sources(self):
+        # id -> (url, [urls]) for every chunk: what a rebuild compares to spot moved chunks
+        return {i: (u, json.loads(us or "[]") or [u])
+                for i, u, us in self.db.execute(f"SELECT id, url, {self._col('urls')} FROM docs")}
+
+    def labels(self):
+        # id -> (tags, [urls]) for every chunk: what the search filter bitmaps are made of
+        return {i: (json.loads(t or "[]"), json.loads(us or "[]") or [u]) for i, t, u, us in
+                self.db.execute(f"SELECT id, tags, url, {self._col('urls')} FROM docs")}
+
+    def meta(self):
+        # id -> (url, title, tags, [urls]) for every chunk: what a rebuild compares to spot
+        # kept chunks whose page, title or tags changed
+        return {i: (u, t or "", json.loads(tg or "[]"), json.loads(us or "[]") or [u]) for i, u, t, tg, us in
+                self.db.execute(f"SELECT id, url, title, tags, {self._col('urls')} FROM docs")}
+
+    def apply(self, docs, added, removed, last_seen=None):
+        # One transaction: drop removed ids, (re)write added ones, bump last_seen on the rest.
+        with self.db:
+            self.db.executemany("DELETE FROM docs WHERE id=?", ((int(i),) for i in removed))
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO docs (id, {', '.join(FIELDS)}) VALUES (?{', ?' * len(FIELDS)})",
+                ((int(i), *(json.dumps(docs[i].get(f) or []) if f in JSON_FIELDS else docs[i].get(f) for f in FIELDS))
+                 for i in added))
+            if last_seen:
+                self.db.execute("UPDATE docs SET last_seen=? WHERE last_seen IS NOT ?", (last_seen, last_seen))
+
+    def close(self):
+        self.db.close()
+
+def migrate_json(json_path, path):
+    # One-off import of a docstore.json written by older curate.py versions.
+    with open(json_path, "r", encoding="utf-8") as f:
+        docs = {int(k): v for k, v in json.load(f).items()}
+    if os.path.exists(path + ".tmp"):
+        os.remove(path + ".tmp")
+    store = DocStore(path + ".tmp", readonly=False)
+    store.apply(docs, list(docs), [])
+    store.close()
+    os.replace(path + ".tmp", path)
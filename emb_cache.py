@@ -0,0 +1,60 @@
+# emb_cache.py
+import os, sqlite3
+import numpy as np
+
+KB_DIR = os.environ.get("KB_DIR", "kb")
+EMB_CACHE_PATH = os.environ.get("EMB_CACHE_PATH", os.path.join(KB_DIR, "emb_cache.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    model TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vec BLOB NOT NULL,
+    PRIMARY KEY (model, checksum)
+)
+"""
+
+class EmbeddingCache:
+    # Normalized float32 chunk vectors keyed by (embedding model, chunk sha256), so a
+    # KB rebuild only encodes chunks whose text it has never seen with this model.
+    def __init__(self, path=EMB_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+
+    def get_many(self, model, checksums):
+        found = {}
+        checksums = list(dict.fromkeys(checksums))
+        for start in range(0, len(checksums), 500):  # stay under SQLite's bound-parameter limit
+            part = checksums[start:start + 500]
+            rows = self.db.execute(
+                f"SELECT checksum, dim, vec FROM vectors WHERE model=? AND checksum IN ({', '.join('?' * len(part))})",
+                (model, *part))
+            for checksum, dim, blob in rows:
+                found[checksum] = np.frombuffer(blob, dtype="float32", count=dim)
+        return found
+
+    def put_many(self, model, checksums, X):
+        X = np.ascontiguousarray(X, dtype="float32")
+        self.db.executemany(
+            "INSERT OR REPLACE INTO vectors (model, checksum, dim, vec) VALUES (?, ?, ?, ?)",
+            ((model, c, X.shape[1], X[i].tobytes()) for i, c in enumerate(checksums)))
+        self.db.commit()
+
+    def prune(self, model, keep):
+        # Forget this model's vectors for chunks no longer in the KB; other models' rows stay
+        # so switching EMB_MODEL back and forth does not re-encode everything.
+        keep = set(keep)
+        stale = [(model, c) for (c,) in self.db.execute("SELECT checksum FROM vectors WHERE model=?", (model,))
+                 if c not in keep]
+        self.db.executemany("DELETE FROM vectors WHERE model=? AND checksum=?", stale)
+        self.db.commit()
+        return len(stale)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,79 @@
+# embedder.py
+# Embedding backends shared by curate.py and RAGStore (CPU inference only). Every
+# backend encodes to L2-normalized float32 rows:
+#   EMB_BACKEND=torch  SentenceTransformer(EMB_MODEL) as is (default)
+#   EMB_BACKEND=int8   the same model with its Linear layers dynamically quantized to
+#                      int8 (torch.ao): no export step, faster matmuls on CPU
+#   EMB_BACKEND=onnx   ONNX Runtime via sentence-transformers' onnx backend (needs
+#                      `pip install optimum[onnxruntime]`); EMB_ONNX_FILE picks an exported
+#                      file, e.g. onnx/model_qint8_avx512_vnni.onnx for int8 weights
+# EMB_THREADS sets the intra-op threads of torch / ONNX Runtime (0: library default).
+# Vectors are cached per backend (cache_key) and curate.py rebuilds the index when the
+# backend changes; check_embedder.py compares a backend with torch (EMB_PARITY_MIN_COS).
+import os, threading
+import numpy as np
+import startup
+
+EMB_MODEL = os.environ.get("EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMB_BACKEND = os.environ.get("EMB_BACKEND", "torch").lower()
+EMB_THREADS = int(os.environ.get("EMB_THREADS", "0"))
+EMB_ONNX_FILE = os.environ.get("EMB_ONNX_FILE", "")
+EMB_PARITY_MIN_COS = float(os.environ.get("EMB_PARITY_MIN_COS", "0.99"))
+BACKENDS = ("torch", "int8", "onnx")
+
+class Embedder:
+    # One loaded model behind encode(); `model` is the SentenceTransformer itself, for
+    # callers that need its multi-process pool.
+    def __init__(self, name=EMB_MODEL, backend=EMB_BACKEND, threads=EMB_THREADS):
+        if backend not in BACKENDS:
+            raise ValueError(f"EMB_BACKEND must be one of {', '.join(BACKENDS)}, not {backend!r}")
+        self.name, self.backend = name, backend
+        with startup.phase("import sentence_transformers"):
+            import torch
+            from sentence_transformers import SentenceTransformer
+        if threads > 0:
+            torch.set_num_threads(threads)
+        with startup.phase(f"load embedding model ({backend})"):
+            if backend == "onnx":
+                kwargs = {"provider": "CPUExecutionProvider"}
+                if EMB_ONNX_FILE:
+                    kwargs["file_name"] = EMB_ONNX_FILE
+                if threads > 0:
+                    import onnxruntime
+                    opts = onnxruntime.SessionOptions()
+                    opts.intra_op_num_threads = threads
+                    kwargs["session_options"] = opts
+                self.model = SentenceTransformer(name, device="cpu", backend="onnx", model_kwargs=kwargs)
+            else:
+                self.model = SentenceTransformer(name, device="cpu")
+                if backend == "int8":
+                    # in place: no second fp32 copy of the model at load
+                    torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+            self.model.eval()
+        self.dim = self.model.get_sentence_embedding_dimension() or len(self.model.encode("dim"))
+        # queries can be cached in the form the tokenizer would see anyway
+        self.lowercase = bool(getattr(getattr(self.model, "tokenizer", None), "do_lower_case", False))
+
+    def encode(self, texts, batch_size=64):
+        E = self.model.encode(list(texts), batch_size=batch_size, normalize_embeddings=True,
+                              convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(E, dtype="float32").reshape(-1, self.dim)
+
+def backend_id(backend=EMB_BACKEND):
+    # What index_meta.json records: the backend, plus the exported file for onnx
+    return f"onnx:{EMB_ONNX_FILE}" if backend == "onnx" and EMB_ONNX_FILE else backend
+
+def cache_key(name=EMB_MODEL, backend=EMB_BACKEND):
+    # Embedding-cache key: vectors from different backends are never mixed in one index.
+    # torch keeps the bare model name, so caches from before backends stay valid.
+    bid = backend_id(backend)
+    return name if bid == "torch" else f"{name}|{bid}"
+
+_loaded, _lock = {}, threading.Lock()
+
+def load(name=EMB_MODEL, backend=EMB_BACKEND):
+    # One Embedder per (model, backend) per process, shared by every RAGStore.
+    with _lock:
+        if (name, backend) not in _loaded:
+            _loaded[name, backend] = Embedder(name, backend)
+        return _loaded[name, backend]
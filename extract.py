@@ -0,0 +1,201 @@
+# extract.py
+import os, re
+from concurrent.futures import ProcessPoolExecutor
+import lxml.html
+from lxml import etree
+
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+LINK_DENSITY_MAX = float(os.environ.get("LINK_DENSITY_MAX", "0.6"))
+
+DROP_TAGS = ("script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+             "nav", "aside", "form", "button", "select", "input", "textarea", "dialog")
+DROP_ROLES = {"navigation", "banner", "contentinfo", "complementary", "dialog", "alertdialog", "search", "menu", "menubar"}
+BOILERPLATE_MAX_SHARE = float(os.environ.get("BOILERPLATE_MAX_SHARE", "0.5"))
+# Matched against each class / id token as whole hyphen- or underscore-delimited parts:
+# "site-footer" and "cookie_notice" are chrome, "elementor-widget-container",
+# "hero-banner", "menu-pricing" and "social-proof" are not.
+BOILERPLATE = re.compile(
+    r"(?:^|[-_])(?:cookies?|consent|gdpr|cmplz|navbar|nav|navigation|breadcrumbs?|footer|sidebar|"
+    r"newsletter|subscribe|popup|modal|advert|advertisement|ads?|sponsored|skip-link|back-to-top|"
+    r"main-menu|primary-menu|mobile-menu|share-buttons|social-share|social-icons|social-links|"
+    r"sharedaddy|addtoany)(?:$|[-_])", re.I)
+STATE_CLASS = re.compile(r"(?:has|no|with|without)[-_]", re.I)  # "has-sidebar": a layout flag
+KEEP = {"html", "body", "main", "article"}
+BLOCKS = {"p", "div", "section", "article", "main", "header", "footer", "blockquote", "figure", "figcaption",
+          "address", "dl", "dt", "dd", "center", "details", "summary", "hr"}
+LINK_BLOCKS = {"div", "section", "ul", "ol", "table", "p", "header", "footer", "dl"}
+HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_WS = re.compile(r"\s+")
+
+def _parse(html):
+    if isinstance(html, str):
+        html = html.encode("utf-8", errors="ignore")  # lxml rejects str with an encoding declaration
+    try:
+        return lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return None
+
+def _text(el):
+    return _WS.sub(" ", el.text_content()).strip()
+
+def _is_boilerplate(el):
+    if el.tag in KEEP:
+        return False
+    if el.tag in DROP_TAGS or (el.get("role") or "").lower() in DROP_ROLES:
+        return True
+    if el.tag == "header" or el.tag == "footer":
+        # page chrome, unless it is the header/footer of an article inside the content
+        return not any(a.tag in ("article", "main") for a in el.iterancestors())
+    marker = f"{el.get('class') or ''} {el.get('id') or ''}"
+    return any(BOILERPLATE.search(token) and not STATE_CLASS.match(token) for token in marker.split())
+
+def _strip_boilerplate(root):
+    # Chrome is dropped with its subtree, but never an element holding more than
+    # BOILERPLATE_MAX_SHARE of the content root's text: that is the content, whatever
+    # its class or tag says.
+    limit = BOILERPLATE_MAX_SHARE * len(_text(root))
+    stack = [el for el in root if isinstance(el.tag, str)]
+    while stack:
+        el = stack.pop()
+        if _is_boilerplate(el) and len(_text(el)) <= limit:
+            el.drop_tree()
+        else:
+            stack.extend(child for child in el if isinstance(child.tag, str))
+    # Link density, computed bottom-up in one pass: descendants come after their
+    # ancestor in document order, so walking it backwards sees children first.
+    sizes = {}
+    order = list(root.iter(etree.Element))
+    for el in reversed(order):
+        text = len((el.text or "").strip())
+        links = text if el.tag == "a" else 0
+        for child in el:
+            if not isinstance(child.tag, str):
+                continue
+            ct, cl = sizes.get(child, (0, 0))
+            tail = len((child.tail or "").strip())
+            text += ct + tail
+            links += ct if el.tag == "a" else cl
+        sizes[el] = (text, links)
+    share = BOILERPLATE_MAX_SHARE * sizes[root][0]
+    for el in order:
+        if el.tag in LINK_BLOCKS and el.getparent() is not None:
+            text, links = sizes.get(el, (0, 0))
+            if text and links / text > LINK_DENSITY_MAX and text < 2000 and text <= share:
+                el.drop_tree()
+
+def _content_root(doc):
+    body = doc.find("body")
+    body = body if body is not None else doc
+    total = len(_text(body)) or 1
+    for tag in ("main", "article"):
+        found = body.findall(f".//{tag}")
+        if len(found) == 1 and len(_text(found[0])) > 0.25 * total:
+            return found[0]
+    return body
+
+class _Markdown:
+    def __init__(self):
+        self.blocks = []
+        self.inline = []
+
+    def flush(self, prefix=""):
+        text = _WS.sub(" ", "".join(self.inline)).strip()
+        self.inline = []
+        if text:
+            self.blocks.append(prefix + text)
+
+    def walk(self, el, depth=0):
+        if not isinstance(el.tag, str):  # comments / processing instructions
+            return
+        tag = el.tag
+        if tag in HEADINGS:
+            self.flush()
+            text = _text(el)
+            if text:
+                self.blocks.append("#" * HEADINGS[tag] + " " + text)
+        elif tag == "pre":
+            self.flush()
+            code = el.text_content().strip("\n")
+            if code.strip():
+                self.blocks.append("```\n" + code + "\n```")
+        elif tag == "table":
+            self.flush()
+            rows = [" | ".join(_text(c) for c in tr if c.tag in ("td", "th")) for tr in el.iter("tr")]
+            rows = [r for r in rows if r.strip(" |")]
+            if rows:
+                self.blocks.append("\n".join(rows))
+        elif tag in ("ul", "ol"):
+            self.flush()
+            for i, li in enumerate(c for c in el if c.tag == "li"):
+                bullet = f"{i + 1}." if tag == "ol" else "-"
+                self.inline.append(li.text or "")
+                for child in li:
+                    if child.tag in ("ul", "ol"):
+                        self.flush("  " * depth + bullet + " ")
+                        self.walk(child, depth + 1)
+                    else:
+                        self.walk(child, depth)
+                    self.inline.append(child.tail or "")
+                self.flush("  " * depth + bullet + " ")
+        elif tag == "br":
+            self.flush()
+        else:
+            block = tag in BLOCKS or tag == "li"
+            if block:
+                self.flush()
+            self.inline.append(el.text or "")
+            for child in el:
+                self.walk(child, depth)
+                self.inline.append(child.tail or "")
+            if block:
+                self.flush()
+
+def extract(html):
+    # One parse per page: title, canonical and raw links come off the full tree, then
+    # chrome (nav/footer/cookie banners, link-dense blocks) is cut and the remaining
+    # content is rendered to markdown straight from the tree.
+    doc = _parse(html)
+    if doc is None:
+        return {"title": "", "text": "", "links": [], "canonical": None}
+    title = doc.findtext(".//title") or ""
+    if not title.strip():
+        h1 = doc.find(".//h1")
+        title = _text(h1) if h1 is not None else ""
+    canonical = None
+    for link in doc.iter("link"):
+        if "canonical" in (link.get("rel") or "").lower().split() and link.get("href"):
+            canonical = link.get("href").strip()
+            break
+    links = [a.get("href") for a in doc.iter("a") if a.get("href")]
+    root = _content_root(doc)
+    _strip_boilerplate(root)
+    md = _Markdown()
+    try:
+        md.walk(root)
+        md.flush()
+        text = "\n\n".join(md.blocks)
+    except RecursionError:  # pathological nesting: plain text is better than nothing
+        text = _text(root)
+    return {"title": _WS.sub(" ", title).strip(), "text": text, "links": links, "canonical": canonical}
+
+def extract_text(html):
+    return extract(html)["text"]
+
+_pool = None
+
+def process_pool(warm=False):
+    # Extraction is CPU-bound (GIL), so it runs in a process pool shared per process.
+    # warm=True starts the workers right away; callers that go on to start threads
+    # should do that first so fork never happens in a threaded process.
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, EXTRACT_WORKERS))
+        if warm:
+            list(_pool.map(len, [""] * max(1, EXTRACT_WORKERS)))
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
@@ -0,0 +1,131 @@
+# kb_filters.py
+# Id bitmaps for metadata-filtered search, built by curate.py with every KB version and
+# handed to FAISS as an IDSelectorBitmap (and to the BM25 side as a mask), so a filtered
+# query only scores the chunks it may return instead of over-fetching and dropping:
+#   filters.json  {"tags": {tag: row}, "prefixes": {path prefix: row}}
+#   filters.npy   uint8 (rows, bytes); FAISS id i is bit i & 7 of byte i >> 3 of a row
+# Prefixes are the site's directories ("/services", "/services/hvac") down to
+# FILTER_PREFIX_DEPTH segments; a chunk is under a prefix when any page it appears on
+# is. Other prefixes (deeper ones, single pages) are computed from the docstore on
+# first use.
+import os, json, threading
+from urllib.parse import urlsplit
+import numpy as np
+import faiss
+
+FILTER_PREFIX_DEPTH = int(os.environ.get("FILTER_PREFIX_DEPTH", "2"))
+FILTERS_JSON, FILTERS_NPY = "filters.json", "filters.npy"
+_EXTRA_PREFIXES = 64  # computed prefixes kept per KB version
+
+def url_path(url):
+    # "https://site/services/hvac/?x=1" or "services/hvac" -> "/services/hvac"
+    path = urlsplit(url).path if "://" in url else url.split("?")[0]
+    return "/" + "/".join(s for s in path.split("/") if s)
+
+def prefixes(url, depth=FILTER_PREFIX_DEPTH):
+    # the directories a page is in: "/services/hvac/repair" -> "/services", "/services/hvac"
+    parts = url_path(url).split("/")[1:]
+    return ["/" + "/".join(parts[:n]) for n in range(1, min(depth, len(parts) - 1) + 1)]
+
+def _under(url, prefix):
+    path = url_path(url)
+    return path == prefix or path.startswith(prefix + "/")
+
+def _row(ids, nbytes):
+    bits = np.zeros(nbytes * 8, dtype=bool)
+    bits[list(ids)] = True
+    return np.packbits(bits, bitorder="little")
+
+def build(docs, out_dir=None, depth=FILTER_PREFIX_DEPTH):
+    # docs: {faiss id: (tags, [urls])}. Returns (keys, bitmaps); written to out_dir if given.
+    members, dirs = {"tags": {}, "prefixes": {}}, set()
+    for i, (tags, urls) in docs.items():
+        paths = set()
+        for u in urls:
+            up = prefixes(u, depth)
+            dirs.update(up)
+            paths.update(up)
+            paths.add(url_path(u))  # a page that is also a directory ("/services") is under it
+        for kind, names in (("tags", set(tags)), ("prefixes", paths)):
+            for name in names:
+                members[kind].setdefault(name, []).append(i)
+    members["prefixes"] = {p: ids for p, ids in members["prefixes"].items() if p in dirs}
+    keys, rows = {"tags": {}, "prefixes": {}}, []
+    for kind in keys:
+        for name, ids in members[kind].items():
+            keys[kind][name] = len(rows)
+            rows.append(ids)
+    nbytes = (max(docs, default=-1) + 8) // 8
+    bits = np.zeros((len(rows), nbytes), dtype=np.uint8)
+    for row, ids in enumerate(rows):
+        bits[row] = _row(ids, nbytes)
+    if out_dir:
+        with open(os.path.join(out_dir, FILTERS_JSON), "w", encoding="utf-8") as f:
+            json.dump(keys, f, ensure_ascii=False)
+        np.save(os.path.join(out_dir, FILTERS_NPY), bits)
+    return keys, bits
+
+class FilterIndex:
+    def __init__(self, keys, bits, docstore=None):
+        self.tags, self.prefixes, self.bits = keys["tags"], keys["prefixes"], bits
+        self.nbytes = bits.shape[1] if bits.ndim == 2 else 0
+        self.docstore, self._extra, self._lock = docstore, {}, threading.Lock()
+
+    @classmethod
+    def load(cls, path, docstore=None):
+        # the version's precomputed bitmaps, or (KBs built before them) bitmaps made from
+        # the docstore at load time
+        if os.path.exists(os.path.join(path, FILTERS_JSON)):
+            with open(os.path.join(path, FILTERS_JSON), "r", encoding="utf-8") as f:
+                keys = json.load(f)
+            return cls(keys, np.load(os.path.join(path, FILTERS_NPY), mmap_mode="r"), docstore)
+        return cls(*build(docstore.labels()), docstore)
+
+    def _prefix(self, prefix):
+        row = self.prefixes.get(prefix)
+        if row is not None:
+            return self.bits[row]
+        with self._lock:
+            if prefix not in self._extra:
+                if len(self._extra) >= _EXTRA_PREFIXES:
+                    self._extra.pop(next(iter(self._extra)))
+                ids = [i for i, (_, urls) in self.docstore.sources().items() if any(_under(u, prefix) for u in urls)] \
+                    if self.docstore is not None else []
+                self._extra[prefix] = _row([i for i in ids if i < self.nbytes * 8], self.nbytes)
+            return self._extra[prefix]
+
+    def bitmap(self, filter):
+        # filter: {"tags": [...], "url_prefix": "/services" or [...]}; tags (any of) and
+        # prefixes (any of) are ANDed. None when nothing is restricted.
+        if not filter:
+            return None
+        out = None
+        tags = filter.get("tags")
+        if tags:
+            tags = [tags] if isinstance(tags, str) else tags
+            rows = [self.tags[t] for t in tags if t in self.tags]
+            out = (np.bitwise_or.reduce(self.bits[rows], axis=0) if rows
+                   else np.zeros(self.nbytes, dtype=np.uint8))
+        prefix = filter.get("url_prefix")
+        if prefix:
+            paths = {url_path(p) for p in ([prefix] if isinstance(prefix, str) else prefix)}
+            if "/" not in paths:
+                rows = np.bitwise_or.reduce([self._prefix(p) for p in paths], axis=0)
+                out = rows if out is None else out & rows
+        return None if out is None else np.ascontiguousarray(out, dtype=np.uint8)
+
+def count(bitmap):
+    return int(np.unpackbits(bitmap).sum())
+
+def selector(bitmap):
+    # FAISS view of a bitmap; it points into bitmap's memory, so keep bitmap alive
+    return faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+
+def allowed(bitmap, ids):
+    # bool per FAISS id: is it set in bitmap?
+    ids = np.asarray(ids, dtype=np.int64)
+    byte = ids >> 3
+    ok = (byte >= 0) & (byte < len(bitmap))
+    out = np.zeros(len(ids), dtype=bool)
+    out[ok] = (bitmap[byte[ok]] >> (ids[ok] & 7).astype(np.uint8)) & 1 == 1
+    return out
@@ -0,0 +1,120 @@
+# kb_versions.py
+# Each curate.py build is written to kb/versions/<version>/ (index, docstore, meta) and
+# published by atomically replacing the one-line kb/CURRENT pointer; readers never see
+# a half-written build. Old versions are kept for instant rollback:
+#   python kb_versions.py list
+#   python kb_versions.py rollback [version]   (default: the version before CURRENT)
+#   python kb_versions.py prune
+import os, sys, time, shutil
+
+KB_DIR = os.environ.get("KB_DIR", "kb")
+KB_KEEP_VERSIONS = int(os.environ.get("KB_KEEP_VERSIONS", "3"))
+POINTER = "CURRENT"
+ARTIFACTS = ("embeddings.index", "docstore.sqlite", "index_meta.json", "docstore.json")
+
+def versions_root(kb_dir=KB_DIR):
+    return os.path.join(kb_dir, "versions")
+
+def version_dir(name, kb_dir=KB_DIR):
+    return os.path.join(versions_root(kb_dir), name)
+
+def list_versions(kb_dir=KB_DIR):
+    # Published builds, oldest first (names sort by build time).
+    root = versions_root(kb_dir)
+    if not os.path.isdir(root):
+        return []
+    return sorted(n for n in os.listdir(root)
+                  if not n.endswith(".building") and os.path.isdir(os.path.join(root, n)))
+
+def current_version(kb_dir=KB_DIR):
+    try:
+        with open(os.path.join(kb_dir, POINTER), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name if name and os.path.isdir(version_dir(name, kb_dir)) else None
+
+def active_dir(kb_dir=KB_DIR):
+    # Directory holding the live index + docstore: the CURRENT version, or kb/ itself for
+    # KBs built before versioning (None if there is no KB at all).
+    name = current_version(kb_dir)
+    if name:
+        return version_dir(name, kb_dir)
+    if any(os.path.exists(os.path.join(kb_dir, a)) for a in ARTIFACTS):
+        return kb_dir
+    return None
+
+def new_version(kb_dir=KB_DIR):
+    # Fresh build directory <version>.building; publish() renames it into place.
+    os.makedirs(versions_root(kb_dir), exist_ok=True)
+    base = time.strftime("%Y%m%d-%H%M%S")
+    name, n = base, 1
+    while os.path.exists(version_dir(name, kb_dir)) or os.path.exists(version_dir(name, kb_dir) + ".building"):
+        n += 1
+        name = f"{base}-{n}"
+    path = version_dir(name, kb_dir) + ".building"
+    os.makedirs(path)
+    return name, path
+
+def set_current(name, kb_dir=KB_DIR):
+    tmp = os.path.join(kb_dir, f"{POINTER}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(kb_dir, POINTER))
+
+def publish(name, kb_dir=KB_DIR, keep=KB_KEEP_VERSIONS):
+    # Make a finished build live: rename it into place, swing CURRENT, drop old versions.
+    os.replace(version_dir(name, kb_dir) + ".building", version_dir(name, kb_dir))
+    set_current(name, kb_dir)
+    for artifact in ARTIFACTS:  # pre-versioning files in kb/ are superseded now
+        try:
+            os.remove(os.path.join(kb_dir, artifact))
+        except FileNotFoundError:
+            pass
+    prune(kb_dir, keep)
+    return version_dir(name, kb_dir)
+
+def prune(kb_dir=KB_DIR, keep=KB_KEEP_VERSIONS):
+    # Keep the newest `keep` versions and always CURRENT. Processes still serving a removed
+    # version keep their open/mapped files until they swap (ignored where the OS refuses).
+    current = current_version(kb_dir)
+    names = list_versions(kb_dir)
+    removed = []
+    for name in names[:max(0, len(names) - max(1, keep))]:
+        if name != current:
+            shutil.rmtree(version_dir(name, kb_dir), ignore_errors=True)
+            removed.append(name)
+    root = versions_root(kb_dir)
+    for n in os.listdir(root) if os.path.isdir(root) else ():
+        path = os.path.join(root, n)
+        if n.endswith(".building") and os.path.getmtime(path) < time.time() - 86400:
+            shutil.rmtree(path, ignore_errors=True)  # left behind by a crashed build
+    return removed
+
+def rollback(to=None, kb_dir=KB_DIR):
+    names = list_versions(kb_dir)
+    current = current_version(kb_dir)
+    if to is None:
+        older = [n for n in names if current is None or n < current]
+        if not older:
+            raise SystemExit("No older version to roll back to.")
+        to = older[-1]
+    if to not in names:
+        raise SystemExit(f"Unknown version {to!r}. Available: {', '.join(names) or 'none'}")
+    set_current(to, kb_dir)
+    return to
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if cmd == "list":
+        current = current_version()
+        for name in list_versions():
+            print(("* " if name == current else "  ") + name)
+    elif cmd == "rollback":
+        print("CURRENT ->", rollback(sys.argv[2] if len(sys.argv) > 2 else None))
+    elif cmd == "prune":
+        print("removed:", ", ".join(prune()) or "nothing")
+    else:
+        raise SystemExit("usage: python kb_versions.py [list | rollback [version] | prune]")
@@ -0,0 +1,90 @@
+# keywords.py
+# Keyword rules shared by curate.tag_chunk and agents.route_intent. Each vocabulary
+# ({label: [keywords]}, label order = priority) is compiled once: keywords only match
+# as whole words (plus plural -s/-es), "word*" matches any word starting with "word",
+# and phrases match across any whitespace. Vocabularies can be replaced from
+# KEYWORDS_FILE (JSON with any of "tags", "intents", "tag_intents").
+import os, re, json
+from functools import lru_cache
+
+KEYWORDS_FILE = os.environ.get("KEYWORDS_FILE", "keywords.json")
+
+TAGS = {
+    "services": ["service", "offer", "solution", "we provide"],
+    "pricing": ["price", "pricing", "cost", "quote"],
+    "contact": ["contact", "address", "phone", "email", "location"],
+    "faq": ["faq", "frequently asked"],
+}
+INTENTS = {
+    "sales_services": ["price", "pricing", "quote", "cost", "package", "buy", "purchase", "service", "lead"],
+    "support_policies": ["refund", "warranty", "policy", "support", "repair", "return"],
+    "logistics_contact": ["contact", "phone", "email", "address", "where", "location", "hours", "timing"],
+    "general_about": ["about", "team", "who are you", "case study", "projects", "portfolio"],
+}
+# retrieved chunks' tags vote for an intent when the question itself matched nothing
+TAG_INTENTS = {
+    "services": "sales_services", "pricing": "sales_services",
+    "faq": "support_policies", "policy": "support_policies", "support": "support_policies",
+    "contact": "logistics_contact", "location": "logistics_contact",
+    "about": "general_about", "general": "general_about", "case_studies": "general_about",
+}
+
+def _compile(keyword):
+    # "cost" -> ("cost", tail matching an optional plural and the end of the word);
+    # phrases search for their first word and match the rest across any whitespace
+    kw = " ".join(keyword.lower().split())
+    head, _, rest = kw.rstrip("*").partition(" ")
+    tail = "".join(r"\s+" + re.escape(w) for w in rest.split())
+    ending = r"\w*" if kw.endswith("*") else (r"(?:e?s)?" if kw[-1:].isalpha() else "")
+    return head, re.compile(tail + ending + r"(?!\w)")
+
+def _matches(text, kws):
+    # str.find runs at C speed over the text; only actual occurrences of a keyword are
+    # checked for word boundaries, so "cost" never matches inside "costume"
+    find = text.find
+    for head, tail in kws:
+        pos = find(head)
+        while pos != -1:
+            if (pos == 0 or not (text[pos - 1].isalnum() or text[pos - 1] == "_")) and tail.match(text, pos + len(head)):
+                return True
+            pos = find(head, pos + 1)
+    return False
+
+class KeywordMatcher:
+    # {label: [keywords]} compiled once; label order is priority.
+    def __init__(self, rules):
+        self.labels_order = list(rules)
+        self._rules = [(label, [_compile(w) for w in words if w.strip("* ")]) for label, words in rules.items()]
+
+    def labels(self, text):
+        # every label with a keyword in text, in rule order
+        text = text.lower()
+        return [label for label, kws in self._rules if _matches(text, kws)]
+
+    def first(self, text):
+        # highest-priority label matched, or None; stops at the first label that matches
+        text = text.lower()
+        return next((label for label, kws in self._rules if _matches(text, kws)), None)
+
+@lru_cache(maxsize=None)
+def _config():
+    try:
+        with open(KEYWORDS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+@lru_cache(maxsize=None)
+def tag_matcher():
+    return KeywordMatcher(_config().get("tags") or TAGS)
+
+@lru_cache(maxsize=None)
+def intent_matcher():
+    return KeywordMatcher(_config().get("intents") or INTENTS)
+
+def tag_intents():
+    return _config().get("tag_intents") or TAG_INTENTS
+
+def intent_tags(label):
+    # the chunk tags that vote for an intent (TAG_INTENTS read backwards)
+    return [tag for tag, intent in tag_intents().items() if intent == label]
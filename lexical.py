@@ -0,0 +1,132 @@
+# lexical.py
+# BM25 inverted index over the chunk texts, built by curate.py next to embeddings.index
+# and memory-mapped by RAGStore. Every posting stores its precomputed BM25 weight, so
+# scoring a query is numpy sums over its terms' postings:
+#   bm25/terms.json   vocabulary; term i's postings are offsets[i]:offsets[i + 1]
+#   bm25/offsets.npy  int64
+#   bm25/rows.npy     int32, chunk row of each posting (ascending within a term)
+#   bm25/weights.npy  float32, BM25 weight of the term in that chunk
+#   bm25/maxw.npy     float32, largest weight of each term
+#   bm25/ids.npy      int64, FAISS id of each chunk row
+import os, re, json
+from array import array
+from collections import Counter
+import numpy as np
+from kb_filters import allowed
+
+BM25_K1 = float(os.environ.get("BM25_K1", "1.2"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+BM25_SCAN_POSTINGS = int(os.environ.get("BM25_SCAN_POSTINGS", "10000"))
+LEXICAL_DIR = "bm25"
+_TOKEN = re.compile(r"\w+(?:[-./+@]\w+)*")
+_PART = re.compile(r"\w+")
+
+def tokenize(text):
+    # Lower-cased words; codes like "hx-200", "3.5kw" or "555-0100" are kept whole and
+    # also split into their parts, so either form finds them.
+    out = []
+    for tok in _TOKEN.findall(text.lower()):
+        out.append(tok)
+        parts = _PART.findall(tok)
+        if len(parts) > 1:
+            out.extend(parts)
+    return out
+
+def build(docs, out_dir):
+    # docs: {faiss id: text}. Returns the number of postings written.
+    ids = np.fromiter(docs, dtype=np.int64, count=len(docs))
+    vocab, rows, terms, tfs = {}, array("i"), array("i"), array("i")
+    lengths = np.zeros(len(ids), dtype=np.float32)
+    for row, i in enumerate(ids.tolist()):
+        counts = Counter(tokenize(docs[i]))
+        lengths[row] = sum(counts.values())
+        rows.extend([row] * len(counts))
+        terms.extend(vocab.setdefault(t, len(vocab)) for t in counts)
+        tfs.extend(counts.values())
+    rows, terms = np.frombuffer(rows, dtype=np.int32), np.frombuffer(terms, dtype=np.int32)
+    tf = np.frombuffer(tfs, dtype=np.int32).astype(np.float32)
+    n, df = len(ids), np.bincount(terms, minlength=len(vocab))
+    idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+    norm = 1 - BM25_B + BM25_B * lengths[rows] / max(float(lengths.mean()), 1.0)
+    weights = idf[terms] * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+    order = np.argsort(terms, kind="stable")  # by term, rows ascending within a term
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(df, out=offsets[1:])
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump(list(vocab), f, ensure_ascii=False)
+    np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(out_dir, "rows.npy"), rows[order])
+    np.save(os.path.join(out_dir, "weights.npy"), weights[order].astype(np.float32))
+    maxw = np.zeros(len(vocab), dtype=np.float32)
+    np.maximum.at(maxw, terms, weights)
+    np.save(os.path.join(out_dir, "maxw.npy"), maxw)
+    np.save(os.path.join(out_dir, "ids.npy"), ids)
+    return len(rows)
+
+class LexicalIndex:
+    def __init__(self, path):
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as f:
+            self.terms = {t: i for i, t in enumerate(json.load(f))}
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.offsets, self.rows, self.weights, self.maxw, self.ids = (
+            load("offsets.npy"), load("rows.npy"), load("weights.npy"), load("maxw.npy"), load("ids.npy"))
+        self.n = len(self.ids)
+
+    def _scores(self, spans):
+        # every chunk in the union of the postings, with its summed weight
+        rows = np.concatenate([self.rows[lo:hi] for lo, hi, _ in spans])
+        weights = np.concatenate([self.weights[lo:hi] for lo, hi, _ in spans])
+        if len(spans) == 1:
+            return rows, weights
+        if len(rows) * 8 < self.n:
+            rows, inverse = np.unique(rows, return_inverse=True)
+            return rows, np.bincount(inverse, weights=weights)
+        scores = np.bincount(rows, weights=weights, minlength=self.n)
+        rows = np.flatnonzero(scores)
+        return rows, scores[rows]
+
+    def _keep(self, rows, scores, bitmap):
+        if bitmap is None:
+            return rows, scores
+        ok = allowed(bitmap, self.ids[rows])
+        return rows[ok], scores[ok]
+
+    def search(self, query, k, scan=BM25_SCAN_POSTINGS, bitmap=None):
+        # (scores, ids) of the k best chunks for query, best first. Exact BM25, but the
+        # longest postings (common words) are usually not scanned: the shortest ones
+        # within `scan` postings give the candidates, the others are only looked up for
+        # those candidates, and that is final when the k-th candidate already scores at
+        # least what the skipped terms could add to any other chunk. Otherwise (or with
+        # scan=0, or when even the shortest postings exceed `scan`) every posting is summed.
+        # bitmap (kb_filters) limits the result to the chunks whose ids are set in it.
+        spans = []
+        for t in set(tokenize(query)):
+            i = self.terms.get(t)
+            if i is not None:
+                spans.append((int(self.offsets[i]), int(self.offsets[i + 1]), float(self.maxw[i])))
+        if not spans or k <= 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        spans.sort(key=lambda s: s[1] - s[0])
+        cut, total = 1, spans[0][1] - spans[0][0]
+        while cut < len(spans) and total + spans[cut][1] - spans[cut][0] <= scan:
+            total += spans[cut][1] - spans[cut][0]
+            cut += 1
+        if scan <= 0 or cut == len(spans) or total > scan:
+            rows, scores = self._keep(*self._scores(spans), bitmap)
+        else:
+            rows, scores = self._keep(*self._scores(spans[:cut]), bitmap)
+            scores = scores.astype(np.float64)
+            for lo, hi, _ in spans[cut:]:
+                term_rows = self.rows[lo:hi]
+                pos = np.searchsorted(term_rows, rows).clip(max=hi - lo - 1)
+                hit = term_rows[pos] == rows
+                scores[hit] += self.weights[lo:hi][pos[hit]]
+            kth = np.partition(scores, len(scores) - k)[len(scores) - k] if len(scores) >= k else 0.0
+            if kth < sum(m for _, _, m in spans[cut:]):  # a chunk outside the candidates could still win
+                rows, scores = self._keep(*self._scores(spans), bitmap)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return scores[order].astype(np.float32), np.asarray(self.ids[rows[order]])
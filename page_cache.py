@@ -0,0 +1,77 @@
+# page_cache.py
+import os, gzip, time
+
+KB_DIR = os.environ.get("KB_DIR", "kb")
+PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR", os.path.join(KB_DIR, "page_cache"))
+PAGE_CACHE_MAX_MB = float(os.environ.get("PAGE_CACHE_MAX_MB", "512"))
+
+class PageCache:
+    # Raw HTML, gzip-compressed, addressed by the page's content_hash from crawl_report.
+    # Files live at <root>/<hash[:2]>/<hash>.html.gz; reads bump mtime so eviction is LRU.
+    def __init__(self, root=PAGE_CACHE_DIR, max_bytes=PAGE_CACHE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash + ".html.gz")
+
+    def has(self, content_hash):
+        return bool(content_hash) and os.path.exists(self.path(content_hash))
+
+    def put(self, content_hash, html):
+        path = self.path(content_hash)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(html)
+        os.replace(tmp, path)
+        return path
+
+    def get(self, content_hash):
+        if not content_hash:
+            return None
+        path = self.path(content_hash)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                html = f.read()
+        except (FileNotFoundError, OSError, EOFError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return html
+
+    def evict(self, keep=()):
+        # Drop least recently used entries until the cache fits max_bytes; hashes in keep survive.
+        keep = set(keep)
+        entries, total = [], 0
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                total += st.st_size
+                if name.endswith(".tmp"):
+                    if st.st_mtime < time.time() - 3600:  # leftover from a crashed writer
+                        os.remove(path); total -= st.st_size
+                    continue
+                if name[:-len(".html.gz")] not in keep:
+                    entries.append((st.st_mtime, st.st_size, path))
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,141 @@
+# politeness.py
+import os, time, threading, urllib.robotparser
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+USER_AGENT = "harriss-autobot/1.0"
+RATE_LIMIT = float(os.environ.get("RATE_LIMIT_RPS", "1.0"))
+RATE_LIMIT_MAX = float(os.environ.get("RATE_LIMIT_MAX_RPS", "8.0"))
+RATE_LIMIT_MIN = float(os.environ.get("RATE_LIMIT_MIN_RPS", "0.1"))
+ROBOTS_TTL = float(os.environ.get("ROBOTS_TTL", "3600"))
+BACKOFF_STATUSES = (429, 503)
+
+def host_key(url):
+    p = urlparse(url)
+    return f"{p.scheme}://{p.netloc}"
+
+def parse_retry_after(value):
+    # Retry-After is either delta-seconds or an HTTP-date.
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+class RobotsCache:
+    # Parsed robots.txt per host, refetched after ROBOTS_TTL seconds.
+    def __init__(self, session, ttl=ROBOTS_TTL):
+        self.session = session
+        self.ttl = ttl
+        self._rules = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _fetch(self, host):
+        rp = urllib.robotparser.RobotFileParser(host + "/robots.txt")
+        ttl = self.ttl
+        try:
+            r = self.session.get(host + "/robots.txt", timeout=15)
+            if r.status_code in (401, 403):
+                rp.disallow_all = True
+            elif r.status_code >= 500:
+                rp.allow_all = True
+                ttl = min(ttl, 60.0)  # origin trouble: retry soon instead of caching for an hour
+            elif r.status_code >= 400:
+                rp.allow_all = True
+            else:
+                rp.parse(r.text.splitlines())
+        except Exception:
+            rp.allow_all = True
+            ttl = min(ttl, 60.0)
+        return rp, time.monotonic() + ttl
+
+    def rules(self, url):
+        host = host_key(url)
+        entry = self._rules.get(host)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        with self._lock:
+            host_lock = self._locks.setdefault(host, threading.Lock())
+        with host_lock:  # one fetch per host even with many workers asking at once
+            entry = self._rules.get(host)
+            if not entry or entry[1] <= time.monotonic():
+                entry = self._rules[host] = self._fetch(host)
+        return entry[0]
+
+    def allowed(self, url):
+        return self.rules(url).can_fetch(USER_AGENT, url)
+
+    def min_interval(self, url):
+        # Seconds between requests demanded by Crawl-delay / Request-rate, 0 if none.
+        rp = self.rules(url)
+        delay = rp.crawl_delay(USER_AGENT) or 0.0
+        rate = rp.request_rate(USER_AGENT)
+        if rate and rate.requests:
+            delay = max(delay, rate.seconds / rate.requests)
+        return float(delay)
+
+    def sitemaps(self, url):
+        return self.rules(url).site_maps() or []
+
+class HostThrottle:
+    # AIMD rate per host: creep up while latency stays near its baseline,
+    # back off when it climbs or the origin answers 429/503.
+    def __init__(self, rate=RATE_LIMIT, max_rate=RATE_LIMIT_MAX, min_rate=RATE_LIMIT_MIN):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.next_slot = 0.0
+        self.blocked_until = 0.0
+        self.latency = None
+        self.baseline = None
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot, self.blocked_until)
+            self.next_slot = slot + 1.0 / self.rate
+            return slot - now
+
+    def record(self, latency, status, retry_after=None):
+        with self.lock:
+            if status in BACKOFF_STATUSES:
+                self.rate = max(self.min_rate, self.rate / 2)
+                wait = parse_retry_after(retry_after)
+                if wait:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+                return
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            self.baseline = latency if self.baseline is None else min(self.baseline, latency)
+            if self.latency > 2 * self.baseline + 0.05:
+                self.rate = max(self.min_rate, self.rate * 0.75)
+            elif status < 400:
+                self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+class Politeness:
+    def __init__(self, session, ttl=ROBOTS_TTL):
+        self.robots = RobotsCache(session, ttl)
+        self._throttles = {}
+        self._lock = threading.Lock()
+
+    def allowed(self, url):
+        return self.robots.allowed(url)
+
+    def throttle(self, url):
+        host = host_key(url)
+        t = self._throttles.get(host)
+        if t is None:
+            interval = self.robots.min_interval(url)
+            max_rate = min(RATE_LIMIT_MAX, 1.0 / interval) if interval else RATE_LIMIT_MAX
+            with self._lock:
+                t = self._throttles.setdefault(host, HostThrottle(min(RATE_LIMIT, max_rate), max_rate))
+        return t
+
+    def admit(self, url):
+        # Throttle for url's host, or None when robots.txt disallows it. Blocking (may fetch robots.txt).
+        return self.throttle(url) if self.allowed(url) else None
@@ -1,52 +1,302 @@
-import os, json, numpy as np
-from sentence_transformers import SentenceTransformer
+import os, json, time, threading, numpy as np
+from collections import OrderedDict
 import faiss
+import ann
+import kb_versions
+import startup
+import embedder
+from lexical import LexicalIndex, LEXICAL_DIR
+from kb_filters import FilterIndex, selector, count
+from docstore import DocStore, DOCSTORE_FILE, migrate_json
 
 KB_DIR = os.environ.get("KB_DIR", "kb")
 EMB_MODEL = os.environ.get("EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+KB_RELOAD_SECS = float(os.environ.get("KB_RELOAD_SECS", "5"))
+SEARCH_OVERFETCH = int(os.environ.get("SEARCH_OVERFETCH", "2"))  # candidates fetched per result slot
+BOILERPLATE_MIN_PAGES = int(os.environ.get("BOILERPLATE_MIN_PAGES", "5"))
+SEARCH_MAX_BOILERPLATE = int(os.environ.get("SEARCH_MAX_BOILERPLATE", "1"))
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "2048"))  # 0 disables
+QUERY_BATCH_SIZE = int(os.environ.get("QUERY_BATCH_SIZE", "64"))
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "hybrid").lower()  # hybrid | vector | lexical
+RRF_K = int(os.environ.get("RRF_K", "60"))
+QUERY_WARMUP_FILE = os.environ.get("QUERY_WARMUP_FILE", os.path.join(KB_DIR, "warm_queries.txt"))
+
+class QueryCache:
+    # Bounded LRU of normalized query vectors keyed by (model, KB version, query text).
+    # The version in the key means nothing cached against one KB is served for the next.
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return vec
+
+    def put(self, key, vec):
+        if self.size <= 0:
+            return
+        vec.setflags(write=False)  # shared by every caller that hits it
+        with self._lock:
+            self._data[key] = vec
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def drop_other_versions(self, version):
+        with self._lock:
+            for key in [k for k in self._data if k[1] != version]:
+                del self._data[key]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+class KBSnapshot:
+    # One published KB version: index, docstore and index parameters that belong together.
+    # Never modified after loading; a newer version means a new snapshot.
+    def __init__(self, path, version, emb_dim):
+        self.path, self.version = path, version
+        self.params = {"type": "flat", "metric": "ip"}
+        self.docstore = self.lexical = self._filters = None
+        self._filters_lock = threading.Lock()
+        if path is None:  # nothing built yet
+            self.index = ann.empty_index(emb_dim)
+            return
+        index_path = os.path.join(path, "embeddings.index")
+        docstore_path = os.path.join(path, DOCSTORE_FILE)
+        legacy_path = os.path.join(path, "docstore.json")
+
+        # Index parameters (type, storage, nprobe / efSearch) from index_meta.json; the
+        # index itself is memory-mapped read-only where faiss supports it (INDEX_MMAP=0 to read it in)
+        try:
+            with open(os.path.join(path, "index_meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.params = meta.get("index") or self.params
+            if meta.get("backend", "torch") != embedder.backend_id():
+                print(f"⚠️ KB built with EMB_BACKEND={meta.get('backend', 'torch')}, queries use "
+                      f"{embedder.backend_id()}: rebuild it (curate.py) to match")
+        except (OSError, ValueError):
+            pass
+        if os.path.exists(index_path):
+            self.index = ann.read_index(index_path, self.params)
+        else:
+            print("⚠️ embeddings.index not found, using an empty FAISS index...")
+            self.index = ann.empty_index(emb_dim)
+        if self.index.ntotal == 0 and self.index.metric_type != faiss.METRIC_INNER_PRODUCT:
+            self.index = ann.empty_index(emb_dim)  # placeholder left by older versions
+        ann.configure(self.index, self.params)
+
+        # Ensure docstore exists (KBs built before docstore.sqlite are converted once)
+        if not os.path.exists(docstore_path) and os.path.exists(legacy_path):
+            print("⚠️ converting docstore.json to", DOCSTORE_FILE)
+            migrate_json(legacy_path, docstore_path)
+        if os.path.exists(docstore_path):
+            # Read-only and memory-mapped: records are read per hit, never held in memory
+            self.docstore = DocStore(docstore_path)
+        else:
+            print(f"⚠️ {DOCSTORE_FILE} not found, serving an empty KB...")
+        # BM25 postings (KBs built before lexical.py have none: vector search only)
+        if os.path.exists(os.path.join(path, LEXICAL_DIR, "terms.json")):
+            self.lexical = LexicalIndex(os.path.join(path, LEXICAL_DIR))
+
+    def bitmap(self, filter):
+        # Id bitmap for a search filter (kb_filters), or None for no filter. The bitmaps
+        # are loaded on the first filtered search (made from the docstore for KBs built
+        # before curate.py wrote them).
+        if not filter or self.docstore is None:
+            return None
+        if self._filters is None:
+            with self._filters_lock:
+                if self._filters is None:
+                    self._filters = FilterIndex.load(self.path, self.docstore)
+        return self._filters.bitmap(filter)
 
 class RAGStore:
     def __init__(self, kb_dir: str = KB_DIR, emb_model: str = EMB_MODEL):
         self.kb_dir = kb_dir
         os.makedirs(self.kb_dir, exist_ok=True)  # Ensure kb directory exists
 
-        self.model = SentenceTransformer(emb_model)
-        emb_dim = self.model.get_sentence_embedding_dimension()
+        self.emb_model = emb_model
+        self.embedder = embedder.load(emb_model)  # EMB_BACKEND: torch, int8 or onnx
+        self.model, self.emb_dim = self.embedder.model, self.embedder.dim
+        # queries are cached (and encoded) in the form the tokenizer would see anyway
+        self._lowercase = self.embedder.lowercase
+        self.query_cache = QueryCache()
 
-        index_path = os.path.join(self.kb_dir, "embeddings.index")
-        docstore_path = os.path.join(self.kb_dir, "docstore.json")
+        self._reload_lock = threading.Lock()
+        self._checked = time.monotonic()
+        with startup.phase("load KB (index, docstore, BM25)"):
+            self.snapshot = self._load()
+        snap = self.snapshot
+        print("✅ FAISS index loaded successfully:", snap.path or "(no KB yet)",
+              ann.factory_string(snap.params), f"version {snap.version or '-'}")
+        print("✅ Docstore size:", len(snap.docstore) if snap.docstore else 0)
+        with startup.phase("warm up query cache"):
+            self.warm_up()
 
-        # Ensure FAISS index exists
-        if not os.path.exists(index_path):
-            print("⚠️ embeddings.index not found, creating new FAISS index...")
-            index = faiss.IndexFlatL2(emb_dim)
-            faiss.write_index(index, index_path)
+    # Views of the live snapshot, for callers that used the attributes directly
+    index = property(lambda self: self.snapshot.index)
+    docstore = property(lambda self: self.snapshot.docstore)
+    index_params = property(lambda self: self.snapshot.params)
+    version = property(lambda self: self.snapshot.version)
 
-        # Load index
-        self.index = faiss.read_index(index_path)
+    def _load(self):
+        version = kb_versions.current_version(self.kb_dir)
+        path = kb_versions.version_dir(version, self.kb_dir) if version else kb_versions.active_dir(self.kb_dir)
+        return KBSnapshot(path, version, self.emb_dim)
 
-        # Ensure docstore exists
-        if os.path.exists(docstore_path):
-            with open(docstore_path, "r", encoding="utf-8") as f:
-                self.docstore = json.load(f)
-        else:
-            print("⚠️ docstore.json not found, initializing empty docstore...")
-            self.docstore = {}
-
-        print("✅ FAISS index loaded successfully:", index_path)
-        print("✅ Docstore size:", len(self.docstore))
-
-    def search(self, query: str, k: int = 6):
-        qv = self.model.encode(query, normalize_embeddings=True).astype("float32")
-        D, I = self.index.search(np.array([qv]), k)
-        hits = []
-        for score, idx in zip(D[0], I[0]):
-            if idx == -1:
-                continue
-            rec = self.docstore.get(str(int(idx)))
-            if not rec:
+    def _swap(self):
+        try:
+            snap = self._load()
+            self.warm_up(version=snap.version)
+            # One reference rebind: searches already running finish on the snapshot they
+            # started with, new ones see the new version; nothing waits on the load.
+            self.snapshot = snap
+            self.query_cache.drop_other_versions(snap.version)
+            print("🔄 KB switched to version", snap.version)
+        except Exception as e:
+            print("⚠️ KB reload failed, still serving version", self.snapshot.version, "-", e)
+        finally:
+            self._reload_lock.release()
+
+    def maybe_reload(self):
+        # At most every KB_RELOAD_SECS: if CURRENT points elsewhere (new build, rollback),
+        # load that version on a background thread and swap it in when ready.
+        now = time.monotonic()
+        if now - self._checked < KB_RELOAD_SECS:
+            return
+        self._checked = now
+        if kb_versions.current_version(self.kb_dir) == self.snapshot.version:
+            return
+        if self._reload_lock.acquire(blocking=False):  # one loader at a time
+            threading.Thread(target=self._swap, daemon=True).start()
+
+    def reload(self):
+        # Synchronous switch to whatever CURRENT names now.
+        self._reload_lock.acquire()
+        self._swap()
+        return self.snapshot.version
+
+    def _normalize(self, query):
+        query = " ".join(query.split())
+        return query.lower() if self._lowercase else query
+
+    def embed_queries(self, queries, version=None):
+        # (n, dim) float32 rows. Cached vectors are reused; the misses are encoded
+        # together in one batched forward pass.
+        texts = [self._normalize(q) for q in queries]
+        Q = np.empty((len(texts), self.emb_dim), dtype="float32")
+        missing = {}
+        for row, text in enumerate(texts):
+            qv = self.query_cache.get((self.emb_model, version, text))
+            if qv is None:
+                missing.setdefault(text, []).append(row)
+            else:
+                Q[row] = qv
+        if missing:
+            vecs = self.embedder.encode(list(missing), batch_size=QUERY_BATCH_SIZE)
+            for (text, rows), qv in zip(missing.items(), vecs):
+                Q[rows] = qv
+                self.query_cache.put((self.emb_model, version, text), qv)
+        return Q
+
+    def warm_up(self, queries=None, version=None):
+        # Pre-encode frequent queries (one per line in QUERY_WARMUP_FILE) in one batch, for
+        # the given KB version (default: the one being served).
+        if queries is None:
+            try:
+                with open(QUERY_WARMUP_FILE, "r", encoding="utf-8") as f:
+                    queries = [l for l in f if l.strip()]
+            except OSError:
+                return 0
+        version = self.snapshot.version if version is None else version
+        texts = list(dict.fromkeys(self._normalize(q) for q in queries if q.strip()))
+        texts = texts[:max(0, self.query_cache.size)]
+        if not texts:
+            return 0
+        vecs = self.embedder.encode(texts, batch_size=QUERY_BATCH_SIZE)
+        for text, qv in zip(texts, vecs):
+            self.query_cache.put((self.emb_model, version, text), qv)
+        return len(texts)
+
+    def search(self, query: str, k: int = 6, mode: str = None, filter: dict = None, prefer: dict = None):
+        return self.search_many([query], k, mode, filter, prefer)[0]
+
+    def search_many(self, queries, k: int = 6, mode: str = None, filter: dict = None, prefer: dict = None):
+        # One hit list per query, from one batched encode, one FAISS search over all the
+        # query rows and one docstore read for every id found. mode (default SEARCH_MODE):
+        # "vector", "lexical" (BM25) or "hybrid" - both, merged by reciprocal-rank fusion.
+        # filter, e.g. {"tags": ["pricing", "services"], "url_prefix": "/services"}: only
+        # chunks with any of the tags and on a page under any of the prefixes; both
+        # searches skip every other chunk. prefer (same form): its matches come first, and
+        # slots they cannot fill go to the best of the rest.
+        queries = list(queries)
+        self.maybe_reload()
+        snap = self.snapshot
+        if snap.docstore is None or snap.index.ntotal == 0 or not queries:
+            return [[] for _ in queries]
+        mode = (mode or SEARCH_MODE) if snap.lexical is not None else "vector"
+        Q = self.embed_queries(queries, snap.version) if mode != "lexical" else None
+        bitmap = snap.bitmap(filter)
+        ranked = self._rank(snap, queries, Q, k, mode, bitmap)
+        first = snap.bitmap(prefer) if prefer else None
+        if first is not None:  # None: prefer restricts nothing, the plain ranking already is it
+            first = first if bitmap is None else first & bitmap
+            ranked = [(np.concatenate([a[0], b[0]]), np.concatenate([a[1], b[1]]))
+                      for a, b in zip(self._rank(snap, queries, Q, k, mode, first), ranked)]
+        found = np.unique(np.concatenate([ids for _, ids in ranked]))
+        docs = snap.docstore.get_many(found[found != -1].tolist())
+        return [collect_hits(scores, ids, docs, k) for scores, ids in ranked]
+
+    def _rank(self, snap, queries, Q, k, mode, bitmap):
+        # (scores, ids) candidates per query, limited to the ids set in bitmap (if any)
+        selected = snap.index.ntotal if bitmap is None else count(bitmap)
+        if selected == 0:
+            return [(np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)) for _ in queries]
+        depth = k * max(1, SEARCH_OVERFETCH)
+        if mode != "lexical":
+            sel = None if bitmap is None else selector(bitmap)  # reads bitmap in place
+            D, I = ann.search(snap.index, snap.params, Q, depth, sel, selected / snap.index.ntotal)
+        if mode == "vector":
+            return list(zip(D, I))
+        lex = [snap.lexical.search(q, depth, bitmap=bitmap) for q in queries]
+        return lex if mode == "lexical" else [rrf(a, b) for a, b in zip(zip(D, I), lex)]
+
+def rrf(*rankings, c=RRF_K):
+    # Reciprocal-rank fusion of (scores, ids) rankings: sum of 1 / (c + rank) per id.
+    fused = {}
+    for _, ids in rankings:
+        for rank, i in enumerate(ids.tolist()):
+            if i != -1:
+                fused[i] = fused.get(i, 0.0) + 1.0 / (c + rank + 1)
+    best = sorted(fused.items(), key=lambda x: -x[1])
+    return (np.array([s for _, s in best], dtype=np.float32),
+            np.array([i for i, _ in best], dtype=np.int64))
+
+def collect_hits(scores, ids, docs, k):
+    # Top k of one query's candidates. Chunks found on BOILERPLATE_MIN_PAGES+ pages
+    # (site-wide blocks) get at most SEARCH_MAX_BOILERPLATE of the k slots; repeated
+    # copies (KBs built before chunk dedup) only one.
+    hits, seen, boilerplate = [], set(), 0
+    for score, idx in zip(scores.tolist(), ids.tolist()):
+        doc = docs.get(idx)
+        if doc is None or doc["checksum"] in seen:
+            continue
+        if len(doc["urls"]) >= BOILERPLATE_MIN_PAGES:
+            if boilerplate >= SEARCH_MAX_BOILERPLATE:
                 continue
-            rec_copy = rec.copy()
-            rec_copy["score"] = float(score)
-            hits.append(rec_copy)
-        return hits
+            boilerplate += 1
+        seen.add(doc["checksum"])
+        hits.append(doc.scored(score))
+        if len(hits) == k:
+            break
+    return hits
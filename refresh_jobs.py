@@ -0,0 +1,214 @@
+# refresh_jobs.py
+# Background KB refresh (crawler.py, then curate.py) for the admin panel. The job runs
+# detached from the Streamlit script in its own process, so chat keeps answering while
+# it runs and the app picks the new KB version up when curate.py publishes it.
+#   kb/refresh.lock          single-flight lock (O_EXCL); stale once the heartbeat stops
+#   kb/refresh_job.json      state, current step, heartbeat (written by the runner)
+#   kb/refresh_progress.json pages / chunks done, rate, ETA (written by the steps)
+#   kb/refresh_job.log       output of the steps
+#   kb/refresh.cancel        cancel request; the running step gets Ctrl-C, then is killed
+import os, sys, json, time, signal, subprocess, threading
+
+KB_DIR = os.environ.get("KB_DIR", "kb")
+REFRESH_CANCEL_GRACE = float(os.environ.get("REFRESH_CANCEL_GRACE", "20"))
+REFRESH_STALE_SECS = float(os.environ.get("REFRESH_STALE_SECS", "30"))
+LOCK_FILE = "refresh.lock"
+JOB_FILE = "refresh_job.json"
+PROGRESS_FILE = "refresh_progress.json"
+LOG_FILE = "refresh_job.log"
+CANCEL_FILE = "refresh.cancel"
+STEPS = (("crawl", ["crawler.py", "--resume"]), ("curate", ["curate.py"]))  # --resume: pick up a cancelled crawl
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def _path(name, kb_dir=KB_DIR):
+    return os.path.join(kb_dir, name)
+
+def _write(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# --- progress, called from inside crawler.py / curate.py ---------------------------
+
+_progress = {}
+
+def progress(stage, done, total=None, unit="pages", force=False, **extra):
+    # No-op unless the step runs under the job runner (REFRESH_PROGRESS names the file).
+    # Throttled to ~2 writes/s; the rate is measured from the stage's first report.
+    path = os.environ.get("REFRESH_PROGRESS")
+    if not path:
+        return
+    now = time.time()
+    started = _progress.setdefault(stage, now)
+    if not force and now - _progress.get("_written", 0) < 0.5:
+        return
+    _progress["_written"] = now
+    rate = done / (now - started) if now > started else 0.0
+    eta = (total - done) / rate if total and rate > 0 and total >= done else None
+    try:
+        _write(path, {"stage": stage, "done": done, "total": total, "unit": unit,
+                      "rate": round(rate, 2), "eta": eta and round(eta), "updated": now, **extra})
+    except OSError:
+        pass
+
+# --- admin panel side -------------------------------------------------------------
+
+def status(kb_dir=KB_DIR):
+    # Last known job state merged with the step's progress; "running" jobs whose
+    # heartbeat has stopped (killed server, crashed runner) are reported as "failed".
+    job = _read(_path(JOB_FILE, kb_dir))
+    if job.get("state") in ("running", "cancelling") and time.time() - job.get("heartbeat", 0) > REFRESH_STALE_SECS:
+        job.update(state="failed", error="job runner stopped responding")
+    if job.get("state") in ("running", "cancelling"):
+        job["progress"] = _read(_path(PROGRESS_FILE, kb_dir))
+    return job
+
+def is_running(kb_dir=KB_DIR):
+    return status(kb_dir).get("state") in ("running", "cancelling")
+
+def _acquire(kb_dir):
+    lock = _path(LOCK_FILE, kb_dir)
+    for _ in range(2):
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            # the lock is held unless its job stopped heartbeating (or never started)
+            job = _read(_path(JOB_FILE, kb_dir))
+            age = time.time() - max(job.get("heartbeat", 0), os.path.getmtime(lock) if os.path.exists(lock) else 0)
+            if age <= REFRESH_STALE_SECS:
+                return False
+            _remove(lock)
+            continue
+        os.close(fd)
+        return True
+    return False
+
+def start(kb_dir=KB_DIR):
+    # Launch the runner detached from this process. Returns False when a refresh is
+    # already running (from this or any other session).
+    os.makedirs(kb_dir, exist_ok=True)
+    if not _acquire(kb_dir):
+        return False
+    _remove(_path(CANCEL_FILE, kb_dir))
+    _remove(_path(PROGRESS_FILE, kb_dir))
+    now = time.time()
+    _write(_path(JOB_FILE, kb_dir), {"state": "running", "step": None, "started": now, "heartbeat": now})
+    detach = ({"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS}
+              if os.name == "nt" else {"start_new_session": True})
+    try:
+        subprocess.Popen([sys.executable, os.path.join(HERE, "refresh_jobs.py"), "run"], cwd=HERE,
+                         env={**os.environ, "KB_DIR": os.path.abspath(kb_dir)}, stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **detach)
+    except OSError as e:
+        _write(_path(JOB_FILE, kb_dir), {"state": "failed", "error": str(e), "started": now, "finished": now})
+        _remove(_path(LOCK_FILE, kb_dir))
+        raise
+    return True
+
+def cancel(kb_dir=KB_DIR):
+    if not is_running(kb_dir):
+        return False
+    open(_path(CANCEL_FILE, kb_dir), "w").close()
+    return True
+
+def log_tail(kb_dir=KB_DIR, lines=20):
+    try:
+        with open(_path(LOG_FILE, kb_dir), "rb") as f:
+            f.seek(max(0, os.path.getsize(f.name) - 16384))
+            text = f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return ""
+    # tqdm redraws with \r; keep only the last state of each line
+    return "\n".join(l.rsplit("\r", 1)[-1] for l in text.splitlines()[-lines:])
+
+# --- runner -----------------------------------------------------------------------
+
+def _interrupt(proc):
+    # Ctrl-C for the step and everything it started (crawler saves a --resume checkpoint).
+    try:
+        if os.name == "nt":
+            proc.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(proc.pid, signal.SIGINT)
+    except OSError:
+        pass
+
+def _kill(proc):
+    try:
+        if os.name == "nt":
+            proc.kill()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+def run(kb_dir=KB_DIR):
+    job_path, cancel_path = _path(JOB_FILE, kb_dir), _path(CANCEL_FILE, kb_dir)
+    job = _read(job_path) or {"started": time.time()}
+    job.update(state="running", pid=os.getpid())
+    env = {**os.environ, "KB_DIR": kb_dir, "REFRESH_PROGRESS": _path(PROGRESS_FILE, kb_dir),
+           "PYTHONUNBUFFERED": "1"}
+    group = ({"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt"
+             else {"start_new_session": True})
+    try:
+        with open(_path(LOG_FILE, kb_dir), "wb") as log:
+            for step, args in STEPS:
+                job.update(step=step, heartbeat=time.time())
+                _write(job_path, job)
+                _remove(env["REFRESH_PROGRESS"])
+                proc = subprocess.Popen([sys.executable, *args], cwd=HERE, env=env, stdin=subprocess.DEVNULL,
+                                        stdout=log, stderr=subprocess.STDOUT, **group)
+                interrupted = None
+                while True:
+                    try:
+                        code = proc.wait(timeout=1)
+                        break
+                    except subprocess.TimeoutExpired:
+                        pass
+                    job["heartbeat"] = time.time()
+                    if interrupted is None and os.path.exists(cancel_path):
+                        interrupted = time.time()
+                        job["state"] = "cancelling"
+                        _interrupt(proc)
+                    elif interrupted and time.time() - interrupted > REFRESH_CANCEL_GRACE:
+                        _kill(proc)
+                    _write(job_path, job)
+                if interrupted:
+                    job.update(state="cancelled")
+                    break
+                if code != 0:
+                    job.update(state="failed", error=f"{step} exited with code {code}")
+                    break
+            else:
+                job.update(state="done", step=None)
+    except Exception as e:
+        job.update(state="failed", error=str(e))
+    finally:
+        job.update(finished=time.time(), heartbeat=time.time())
+        _write(job_path, job)
+        _remove(cancel_path)
+        _remove(_path(LOCK_FILE, kb_dir))
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["run"]:
+        run()
+    elif sys.argv[1:2] == ["start"]:
+        print("started" if start() else "a refresh is already running")
+    elif sys.argv[1:2] == ["cancel"]:
+        print("cancel requested" if cancel() else "no refresh running")
+    else:
+        print(json.dumps(status(), indent=2))
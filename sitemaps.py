@@ -0,0 +1,126 @@
+# sitemaps.py
+import io, os, gzip, time
+from datetime import datetime, timedelta, timezone
+from xml.etree.ElementTree import iterparse
+
+SITEMAP_MAX_DEPTH = int(os.environ.get("SITEMAP_MAX_DEPTH", "3"))
+SITEMAP_MAX_URLS = int(os.environ.get("SITEMAP_MAX_URLS", "50000"))
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def parse_lastmod(value):
+    # W3C datetime (YYYY, YYYY-MM, YYYY-MM-DD or full timestamp) -> epoch seconds, None if
+    # unparseable. Values without a time mean the end of that year / month / day: a page
+    # edited later on the day we fetched it must not look older than our copy.
+    if not value:
+        return None
+    value = value.strip()
+    for fmt, step in (("%Y", "year"), ("%Y-%m", "month"), ("%Y-%m-%d", "day")):
+        try:
+            start = datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        if step == "year":
+            end = start.replace(year=start.year + 1)
+        elif step == "month":
+            end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        else:
+            end = start + timedelta(days=1)
+        return end.timestamp() - 1
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def _parse_priority(value):
+    try:
+        return min(1.0, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return None
+
+def _open(session, url):
+    r = session.get(url, timeout=30, stream=True)
+    if r.status_code != 200:
+        r.close()
+        return None, None
+    r.raw.decode_content = True
+    r.raw.auto_close = False  # let BufferedReader see EOF instead of a closed file
+    stream = io.BufferedReader(r.raw, buffer_size=64 * 1024)
+    # .xml.gz files usually arrive as plain application/gzip bodies, not Content-Encoding
+    if stream.peek(2)[:2] == b"\x1f\x8b":
+        stream = gzip.GzipFile(fileobj=stream)
+    return r, stream
+
+def iter_sitemap(session, url, depth=0, visited=None):
+    # Yield (loc, lastmod_epoch, priority) from a sitemap or sitemap index. The XML is
+    # parsed incrementally off the response stream and cleared as it goes, so memory
+    # stays flat on 50k-URL files; index children are followed SITEMAP_MAX_DEPTH levels.
+    visited = set() if visited is None else visited
+    if url in visited or depth > SITEMAP_MAX_DEPTH:
+        return
+    visited.add(url)
+    try:
+        r, stream = _open(session, url)
+    except Exception:
+        return
+    if stream is None:
+        return
+    children = []
+    try:
+        root, level = None, 0
+        fields = {}
+        for event, elem in iterparse(stream, events=("start", "end")):
+            if root is None:
+                root = elem
+                continue
+            if event == "start":
+                level += 1
+                continue
+            level -= 1
+            tag = _local(elem.tag)
+            # Only direct children of <url> / <sitemap>: image:loc, video:* and xhtml:link
+            # sit one level further down and must not replace the page's own <loc>.
+            if level == 1 and tag in ("loc", "lastmod", "priority"):
+                fields[tag] = (elem.text or "").strip()
+            elif level == 0 and tag == "url":
+                if fields.get("loc"):
+                    yield fields["loc"], parse_lastmod(fields.get("lastmod")), _parse_priority(fields.get("priority"))
+                fields = {}
+                root.clear()
+            elif level == 0 and tag == "sitemap":
+                if fields.get("loc"):
+                    children.append(fields["loc"])
+                fields = {}
+                root.clear()
+    except Exception:
+        pass  # a broken sitemap just contributes nothing, like a missing one
+    finally:
+        r.close()
+    for child in children:
+        yield from iter_sitemap(session, child, depth + 1, visited)
+
+def discover(session, sitemap_urls, in_scope, limit=SITEMAP_MAX_URLS):
+    # Merge every reachable sitemap into {url: (lastmod, priority)}, first entry wins.
+    found, visited = {}, set()
+    for sm in sitemap_urls:
+        for loc, lastmod, priority in iter_sitemap(session, sm, visited=visited):
+            if len(found) >= limit:
+                return found
+            if in_scope(loc) and loc not in found:
+                found[loc] = (lastmod, priority)
+    return found
+
+def crawl_priority(depth, lastmod=None, priority=None, now=None):
+    # Frontier key, smaller is sooner: shallow pages first, pulled forward when the
+    # sitemap says they changed recently or rates them highly.
+    key = float(depth)
+    if lastmod:
+        age_days = max(0.0, ((now or time.time()) - lastmod) / 86400)
+        key -= 1.0 / (1.0 + age_days / 7.0)
+    if priority is not None:
+        key -= 0.5 * (priority - 0.5)
+    return key
@@ -0,0 +1,32 @@
+# startup.py
+# Wall time of each startup phase of this process (heavy imports, model, KB load, query
+# warm-up), for the admin panel and bench_startup.py. STARTUP_LOG=1 also prints each
+# phase as it ends.
+import os, time, threading
+from contextlib import contextmanager
+
+STARTUP_LOG = os.environ.get("STARTUP_LOG", "0") == "1"
+T0 = time.perf_counter()  # first import; entry points import this module first
+_phases, _lock = [], threading.Lock()
+
+@contextmanager
+def phase(name):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t)
+
+def record(name, secs):
+    with _lock:
+        _phases.append((name, secs, time.perf_counter() - T0))
+    if STARTUP_LOG:
+        print(f"⏱️ {name}: {secs:.2f}s")
+
+def report():
+    # [(phase, seconds, seconds since T0 when it ended)] in the order they ended
+    with _lock:
+        return list(_phases)
+
+def format_report():
+    return "\n".join(f"{name:<34} {secs:7.2f}s   (done at {at:6.2f}s)" for name, secs, at in report())
@@ -1,31 +1,80 @@
 # streamlit_app.py
+import startup  # first: startup phases are timed from here
 from dotenv import load_dotenv
 load_dotenv()
 
-import os, subprocess, sys
+import os, time
 import streamlit as st
+import agents
 from agents import answer
 from leads import save_lead
+import refresh_jobs
+
+REFRESH_POLL_SECS = float(os.environ.get("REFRESH_POLL_SECS", "2"))
 
 st.set_page_config(page_title="HarrissCES Autobot", layout="wide", page_icon="🤖")
 st.title("🤖 HarrissCES — Multi-Agent Autobot (retrieval-first)")
+agents.preload()  # model + KB load in the background; the page renders meanwhile
 
 col_main, col_right = st.columns([3, 1])
 
 with col_right:
     st.header("Admin / Lead")
     admin_pwd = st.text_input("Admin password (to refresh KB)", type="password")
+    is_admin = admin_pwd == os.environ.get("ADMIN_PASS", "change-me")
     if st.button("Refresh KB (crawl + curate)", key="refresh"):
-        if admin_pwd == os.environ.get("ADMIN_PASS", "change-me"):
-            st.info("Running crawler + curate (this may take a while). Output will appear in console.")
-            try:
-                subprocess.run([sys.executable, "crawler.py"], check=True)
-                subprocess.run([sys.executable, "curate.py"], check=True)
-                st.success("Refresh complete — KB updated.")
-            except subprocess.CalledProcessError as e:
-                st.error(f"Refresh failed: {e}")
-        else:
+        if not is_admin:
             st.error("Incorrect admin password.")
+        elif refresh_jobs.start():
+            st.info("Refresh started in the background; chat keeps working meanwhile.")
+        else:
+            st.warning("A refresh is already running.")
+
+    # Re-drawn every few seconds on its own; the rest of the page is not re-run
+    @(st.fragment(run_every=REFRESH_POLL_SECS) if hasattr(st, "fragment") else (lambda f: f))
+    def refresh_status():
+        job = refresh_jobs.status()
+        state = job.get("state")
+        if not state:
+            return
+        if state in ("running", "cancelling"):
+            prog = job.get("progress") or {}
+            step = prog.get("stage") or job.get("step") or "starting"
+            done, total = prog.get("done", 0), prog.get("total")
+            text = f"{step}: {done}" + (f"/{total}" if total else "") + f" {prog.get('unit', '')}"
+            if "embedded" in prog:
+                text += f", {prog['embedded']}/{prog.get('to_embed', 0)} chunks embedded"
+            if prog.get("eta") is not None:
+                text += f", ~{int(prog['eta']) // 60}m{int(prog['eta']) % 60:02d}s left"
+            if state == "cancelling":
+                text += " (cancelling...)"
+            st.progress(min(1.0, done / total) if total else 0.0, text=text)
+            if state == "running" and st.button("Cancel refresh", key="cancel_refresh"):
+                if is_admin:
+                    refresh_jobs.cancel()
+                else:
+                    st.error("Incorrect admin password.")
+        elif state == "done":
+            st.success(f"Last refresh complete ({time.strftime('%Y-%m-%d %H:%M', time.localtime(job['finished']))}) — KB updated.")
+        elif state == "cancelled":
+            st.warning("Last refresh was cancelled; the KB was left as it was. The next refresh resumes the crawl.")
+        else:
+            st.error(f"Last refresh failed: {job.get('error', 'unknown error')}")
+        if is_admin:
+            with st.expander("Refresh log"):
+                st.text(refresh_jobs.log_tail() or "(empty)")
+
+    refresh_status()
+    if is_admin:
+        if agents.rag_ready():
+            rag = agents.get_rag()
+            qc = rag.query_cache.stats()
+            st.caption(f"KB version {rag.version or '-'} · query cache {qc['size']} entries, "
+                       f"{qc['hits']} hits / {qc['misses']} misses ({qc['hit_rate']:.0%})")
+        else:
+            st.caption("Loading the embedding model and KB...")
+        with st.expander("Startup times"):
+            st.text(startup.format_report() or "(nothing loaded yet)")
 
     st.divider()
     st.subheader("Quick Lead")
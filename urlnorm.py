@@ -0,0 +1,54 @@
+# urlnorm.py
+import re
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote
+
+TRACKING_PARAMS = {
+    "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "igshid", "twclid", "_ga", "_gl",
+    "mc_cid", "mc_eid", "ref", "ref_src", "share", "replytocom",
+    "sessionid", "sid", "phpsessid", "jsessionid", "cfid", "cftoken",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "hsa_", "vero_", "oly_")
+# query switches that only select a printer/AMP rendering of the same page
+VARIANT_FLAGS = {"print", "printable", "printer", "printer_friendly", "amp"}
+VARIANT_MODES = {"output", "view", "format"}
+FIRST_PAGE_PARAMS = {"page", "paged", "pg"}
+VARIANT_SUFFIX = re.compile(r"/(?:print|printable|amp|comment-page-\d+|page/1)/?$", re.I)
+INDEX_FILE = re.compile(r"/(?:index|default)\.(?:html?|php|aspx?)$", re.I)
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+def _keep_param(k, v):
+    kl = k.lower()
+    if kl in TRACKING_PARAMS or kl.startswith(TRACKING_PREFIXES):
+        return False
+    if kl in VARIANT_FLAGS and v.lower() in ("", "1", "true", "yes"):
+        return False
+    if kl in VARIANT_MODES and v.lower() in ("print", "printable", "amp"):
+        return False
+    if kl in FIRST_PAGE_PARAMS and v in ("", "0", "1"):
+        return False
+    return True
+
+def canonicalize(url):
+    # Fetchable canonical form: lower-case scheme/host, no default port, no fragment,
+    # no tracking / print / page-1 parameters, sorted query, clean path. The trailing
+    # slash is kept as given because servers redirect when it is wrong.
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    port = parts.port if parts.port and str(parts.port) != DEFAULT_PORTS.get(scheme) else None
+    netloc = host + (f":{port}" if port else "")
+    if parts.username:
+        netloc = f"{parts.username}{':' + parts.password if parts.password else ''}@{netloc}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    path = quote(path, safe="/:@!$&'()*+,;=-._~%")
+    path = re.sub(r"%[0-9a-f]{2}", lambda m: m.group(0).upper(), path)
+    path = INDEX_FILE.sub("/", path)
+    path = VARIANT_SUFFIX.sub("/", path)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if _keep_param(k, v)]
+    return urlunsplit((scheme, netloc, path, urlencode(sorted(query)), ""))
+
+def url_key(url):
+    # Identity for de-duplication: canonical form with case and trailing slash folded.
+    parts = urlsplit(canonicalize(url))
+    path = parts.path.lower().rstrip("/") or "/"
+    return urlunsplit((parts.scheme, parts.netloc, path, parts.query, ""))